@@ -244,71 +244,74 @@ const ChatInterface = () => {
     ws.onmessage = (event) => {
       if (isUnmounting.current) return;
       try {
-        const data = JSON.parse(event.data);
-        if (data.type === 'response') {
-          setIsAwaitingResponse(false);
-          setMessages(prev => prev.filter(m => m.type !== 'ack'));
-
-          // Normalize suggestions
-          const suggestions = data.action_suggestions?.suggestions || data.suggestions || [];
-          const newContent = data.formatted_response || data.response;
-
-          // SPECIAL HANDLING FOR STAGE 2 UPDATES (Suggestions without new content)
-          // If we receive suggestions but NO content (or empty string), 
-          // we attach them to the LAST assistant message instead of creating a new bubble.
-          if ((!newContent || newContent.trim() === "") && suggestions.length > 0) {
-            console.log("Received async suggestions update:", suggestions);
-
-            setMessages(prev => {
-              // Polyfill-like behavior for findLastIndex
-              let lastIdx = -1;
-              for (let i = prev.length - 1; i >= 0; i--) {
-                if (prev[i].role === 'assistant') {
-                  lastIdx = i;
-                  break;
+        const parsed = JSON.parse(event.data);
+        // The server coalesces bursts of messages into one frame holding an array
+        for (const data of Array.isArray(parsed) ? parsed : [parsed]) {
+          if (data.type === 'response') {
+            setIsAwaitingResponse(false);
+            setMessages(prev => prev.filter(m => m.type !== 'ack'));
+
+            // Normalize suggestions
+            const suggestions = data.action_suggestions?.suggestions || data.suggestions || [];
+            const newContent = data.formatted_response || data.response;
+
+            // SPECIAL HANDLING FOR STAGE 2 UPDATES (Suggestions without new content)
+            // If we receive suggestions but NO content (or empty string), 
+            // we attach them to the LAST assistant message instead of creating a new bubble.
+            if ((!newContent || newContent.trim() === "") && suggestions.length > 0) {
+              console.log("Received async suggestions update:", suggestions);
+
+              setMessages(prev => {
+                // Polyfill-like behavior for findLastIndex
+                let lastIdx = -1;
+                for (let i = prev.length - 1; i >= 0; i--) {
+                  if (prev[i].role === 'assistant') {
+                    lastIdx = i;
+                    break;
+                  }
                 }
-              }
 
-              if (lastIdx !== -1) {
-                console.log("Merging suggestions into message index:", lastIdx);
-                // Clone the array
-                const updated = [...prev];
-                // Update the last message with new suggestions
-                updated[lastIdx] = {
-                  ...updated[lastIdx],
+                if (lastIdx !== -1) {
+                  console.log("Merging suggestions into message index:", lastIdx);
+                  // Clone the array
+                  const updated = [...prev];
+                  // Update the last message with new suggestions
+                  updated[lastIdx] = {
+                    ...updated[lastIdx],
+                    suggestions: suggestions
+                  };
+                  return updated;
+                }
+                // If no previous assistant message, fallback to default behavior
+                return [...prev, {
+                  role: 'assistant',
+                  content: "",
+                  agent: data.agent,
                   suggestions: suggestions
-                };
-                return updated;
-              }
-              // If no previous assistant message, fallback to default behavior
-              return [...prev, {
+                }];
+              });
+            } else {
+              // STANDARD BEHAVIOR: New Message
+              setMessages(prev => [...prev, {
                 role: 'assistant',
-                content: "",
+                content: newContent,
                 agent: data.agent,
                 suggestions: suggestions
+              }]);
+            }
+          } else if (data.type === 'ack') {
+            setMessages(prev => {
+              const filtered = prev.filter(m => m.type !== 'ack');
+              return [...filtered, {
+                role: 'system',
+                content: data.message,
+                type: 'ack'
               }];
             });
-          } else {
-            // STANDARD BEHAVIOR: New Message
-            setMessages(prev => [...prev, {
-              role: 'assistant',
-              content: newContent,
-              agent: data.agent,
-              suggestions: suggestions
-            }]);
+          } else if (data.type === 'processing_cancelled') {
+            setIsAwaitingResponse(false);
+            setMessages(prev => prev.filter(m => m.type !== 'ack'));
           }
-        } else if (data.type === 'ack') {
-          setMessages(prev => {
-            const filtered = prev.filter(m => m.type !== 'ack');
-            return [...filtered, {
-              role: 'system',
-              content: data.message,
-              type: 'ack'
-            }];
-          });
-        } else if (data.type === 'processing_cancelled') {
-          setIsAwaitingResponse(false);
-          setMessages(prev => prev.filter(m => m.type !== 'ack'));
         }
       } catch (e) {
         console.error('Error parsing message:', e);
@@ -619,13 +622,27 @@ const ChatInterface = () => {
         ws.send(bootstrapMsg);
       };
 
+      // Audio events arrive as binary frames, everything else as JSON text
+      ws.binaryType = 'arraybuffer';
+
       ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
+        let data;
+        if (event.data instanceof ArrayBuffer) {
+          // [u32 little-endian header length][JSON event header][raw PCM]
+          const headerLength = new DataView(event.data).getUint32(0, true);
+          data = JSON.parse(new TextDecoder().decode(new Uint8Array(event.data, 4, headerLength)));
+          if (audioPlayerNodeRef.current) {
+            audioPlayerNodeRef.current.port.postMessage(event.data.slice(4 + headerLength));
+          }
+        } else {
+          data = JSON.parse(event.data);
+        }
+
         if (data.outputTranscription && data.outputTranscription.text) {
           setVoiceStatus('speaking');
         }
 
-        // Play audio if present
+        // Play base64 audio if present (binary frames already carried their PCM)
         if (data.content && data.content.parts) {
           data.content.parts.forEach(part => {
             if (part.inlineData && part.inlineData.data) {
@@ -7,13 +7,32 @@ which then uses these tools to call Ollama for actual legal work.
 """
 
 import os
+import asyncio
+import hashlib
 import logging
+from collections import OrderedDict
 import ollama
 from lexedge.prompts.prompt_loader import load_prompt, render_prompt
 
 logger = logging.getLogger(__name__)
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+
+# One async client for the process so tool calls reuse its keep-alive
+# connection pool without blocking the event loop while Ollama generates.
+_aclient = ollama.AsyncClient(host=os.getenv("OLLAMA_HOST"), timeout=OLLAMA_TIMEOUT)
+
+# Recent legal_query answers, keyed on (practice area, query digest).
+# Repeated FAQ-style questions skip generation entirely; set
+# LEXEDGE_CACHE_DISABLE=1 to always call the model.
+LEGAL_QUERY_CACHE_SIZE = int(os.getenv("LEGAL_QUERY_CACHE_SIZE", "1024"))
+_CACHE_DISABLED = os.getenv("LEXEDGE_CACHE_DISABLE") == "1"
+_query_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+# Generations currently running, by the same key, so concurrent identical
+# questions share one model call instead of each starting their own
+_inflight_queries: "dict[tuple, asyncio.Task]" = {}
 
 PRACTICE_PROMPT_FILES = {
     "criminal": "legal_counsel/practice_criminal.txt",
@@ -27,10 +46,107 @@ PRACTICE_PROMPT_FILES = {
     "general": "legal_counsel/practice_general.txt"
 }
 
+_VALID_AREAS = frozenset(PRACTICE_PROMPT_FILES)
+
+ANALYSIS_INSTRUCTION_FILES = {
+    "review": "legal_counsel/document_analysis_review.txt",
+    "risk_scan": "legal_counsel/document_analysis_risk_scan.txt",
+    "summary": "legal_counsel/document_analysis_summary.txt",
+    "clause_check": "legal_counsel/document_analysis_clause_check.txt"
+}
+
 DISCLAIMER = load_prompt("legal_counsel/disclaimer.txt")
 
+# Sampling options per tool; shared read-only by every call
+_QUERY_OPTIONS = {"temperature": 0.5}
+_DRAFT_OPTIONS = {"temperature": 0.3}
+_ANALYSIS_OPTIONS = {"temperature": 0.3}
+
+# Prompt text is static, so each tool's per-area state (system prompt or
+# instruction, plus sampling options) is resolved once here and a call is
+# a single dict lookup
+_PRACTICE_PROMPTS = {area: load_prompt(path) for area, path in PRACTICE_PROMPT_FILES.items()}
+_DRAFTING_MODE = load_prompt("legal_counsel/drafting_mode.txt")
+_DRAFT_USER_TEMPLATE = load_prompt("legal_counsel/draft_document_user_prompt.txt")
+_ANALYSIS_SYSTEM_PROMPT = load_prompt("legal_counsel/document_analysis_system.txt")
+
+_QUERY_DISPATCH = {
+    area: (prompt, _QUERY_OPTIONS) for area, prompt in _PRACTICE_PROMPTS.items()
+}
+_DRAFT_DISPATCH = {
+    area: (prompt + "\n\n" + _DRAFTING_MODE, _DRAFT_OPTIONS)
+    for area, prompt in _PRACTICE_PROMPTS.items()
+}
+_ANALYSIS_DISPATCH = {
+    kind: (load_prompt(path), _ANALYSIS_OPTIONS)
+    for kind, path in ANALYSIS_INSTRUCTION_FILES.items()
+}
+
+
+def _resolve_area(practice_area: str) -> str:
+    """Map a practice_area argument to a known area, defaulting to general.
+
+    The model almost always passes one of the canonical names, so the
+    lowercase/strip normalization only runs when that check misses.
+    """
+    if practice_area in _VALID_AREAS:
+        return practice_area
+    area = practice_area.lower().strip()
+    return area if area in _VALID_AREAS else "general"
+
+
+def _query_cache_key(area: str, query: str) -> tuple:
+    """Key a query by area and a digest of its case/whitespace-normalized text."""
+    normalized = " ".join(query.lower().split())
+    return area, hashlib.sha256(normalized.encode("utf-8")).digest()
+
 
-def legal_query(query: str, practice_area: str = "general") -> dict:
+def _query_cache_get(key: tuple):
+    """Return the cached answer for key, marking it recently used."""
+    content = _query_cache.get(key)
+    if content is not None:
+        _query_cache.move_to_end(key)
+    return content
+
+
+def _query_cache_put(key: tuple, content: str) -> None:
+    """Store an answer, evicting the least recently used one when full."""
+    _query_cache[key] = content
+    _query_cache.move_to_end(key)
+    if len(_query_cache) > LEGAL_QUERY_CACHE_SIZE:
+        _query_cache.popitem(last=False)
+
+
+async def _generate_query_answer(key: tuple, system_prompt: str, options: dict, query: str) -> str:
+    """Ask the model for an answer to query, caching real answers under key."""
+    response = await _aclient.chat(
+        model=OLLAMA_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query},
+        ],
+        options=options,
+    )
+    content = response.get("message", {}).get("content", "")
+    # Only real answers are cached, never the fallback or error text
+    if content and not _CACHE_DISABLED:
+        _query_cache_put(key, content)
+    return content
+
+
+def _query_in_flight(key: tuple, system_prompt: str, options: dict, query: str) -> asyncio.Task:
+    """Return the running generation for key, starting one if none is in flight."""
+    task = _inflight_queries.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_generate_query_answer(key, system_prompt, options, query))
+        _inflight_queries[key] = task
+        task.add_done_callback(lambda _: _inflight_queries.pop(key, None))
+    else:
+        logger.info("[legal_query] joining in-flight request for the same query")
+    return task
+
+
+async def legal_query(query: str, practice_area: str = "general") -> dict:
     """
     Process a legal query using the Ollama LLM.
 
@@ -46,27 +162,30 @@ def legal_query(query: str, practice_area: str = "general") -> dict:
     Returns:
         dict with 'result' containing the legal response text.
     """
-    area = practice_area.lower().strip()
-    system_prompt = load_prompt(PRACTICE_PROMPT_FILES.get(area, PRACTICE_PROMPT_FILES["general"]))
+    area = _resolve_area(practice_area)
+    system_prompt, options = _QUERY_DISPATCH[area]
 
-    logger.info(f"[legal_query] area={area}, model={OLLAMA_MODEL}, query={query[:80]}...")
+    logger.info("[legal_query] area=%s, model=%s, query=%.80s...", area, OLLAMA_MODEL, query)
+
+    cache_key = _query_cache_key(area, query)
+    if not _CACHE_DISABLED:
+        cached = _query_cache_get(cache_key)
+        if cached is not None:
+            logger.info("[legal_query] cache hit, response length=%d", len(cached))
+            return {"result": f"{cached}{DISCLAIMER}"}
 
     try:
-        response = ollama.chat(
-            model=OLLAMA_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query},
-            ],
-            options={"temperature": 0.5},
+        # Shielded so one caller going away doesn't cancel a generation
+        # other callers are waiting on
+        content = await asyncio.shield(
+            _query_in_flight(cache_key, system_prompt, options, query)
         )
-        content = response.get("message", {}).get("content", "")
         if not content:
             content = "I was unable to generate a response. Please try rephrasing your query."
-        logger.info(f"[legal_query] response length={len(content)}")
-        return {"result": content + DISCLAIMER}
+        logger.info("[legal_query] response length=%d", len(content))
+        return {"result": f"{content}{DISCLAIMER}"}
     except Exception as e:
-        logger.error(f"[legal_query] Ollama error [{type(e).__name__}]: {repr(e)}")
+        logger.error("[legal_query] Ollama error [%s]: %r", type(e).__name__, e)
         return {
             "result": (
                 "I encountered an error processing your request. "
@@ -75,7 +194,7 @@ def legal_query(query: str, practice_area: str = "general") -> dict:
         }
 
 
-def draft_document(
+async def draft_document(
     document_type: str,
     facts: str,
     practice_area: str = "general",
@@ -96,34 +215,32 @@ def draft_document(
     Returns:
         dict with 'result' containing the drafted document outline.
     """
-    area = practice_area.lower().strip()
-    system_prompt = load_prompt(PRACTICE_PROMPT_FILES.get(area, PRACTICE_PROMPT_FILES["general"]))
-    system_prompt += "\n\n" + load_prompt("legal_counsel/drafting_mode.txt")
+    area = _resolve_area(practice_area)
+    system_prompt, options = _DRAFT_DISPATCH[area]
 
-    user_prompt_template = load_prompt("legal_counsel/draft_document_user_prompt.txt")
     user_prompt = render_prompt(
-        user_prompt_template,
+        _DRAFT_USER_TEMPLATE,
         document_type=document_type,
         facts=facts
     )
 
-    logger.info(f"[draft_document] type={document_type}, area={area}")
+    logger.info("[draft_document] type=%s, area=%s", document_type, area)
 
     try:
-        response = ollama.chat(
+        response = await _aclient.chat(
             model=OLLAMA_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            options={"temperature": 0.3},
+            options=options,
         )
         content = response.get("message", {}).get("content", "")
         if not content:
             content = "I was unable to generate the document. Please provide more details."
-        return {"result": content + DISCLAIMER}
+        return {"result": f"{content}{DISCLAIMER}"}
     except Exception as e:
-        logger.error(f"[draft_document] Ollama error [{type(e).__name__}]: {repr(e)}")
+        logger.error("[draft_document] Ollama error [%s]: %r", type(e).__name__, e)
         return {
             "result": (
                 "I encountered an error drafting the document. "
@@ -132,7 +249,7 @@ def draft_document(
         }
 
 
-def analyze_document(document_text: str, analysis_type: str = "review") -> dict:
+async def analyze_document(document_text: str, analysis_type: str = "review") -> dict:
     """
     Analyze a legal document (contract, agreement, petition, etc.).
 
@@ -146,40 +263,27 @@ def analyze_document(document_text: str, analysis_type: str = "review") -> dict:
     Returns:
         dict with 'result' containing the analysis.
     """
-    system_prompt = load_prompt("legal_counsel/document_analysis_system.txt")
-
-    analysis_instruction_files = {
-        "review": "legal_counsel/document_analysis_review.txt",
-        "risk_scan": "legal_counsel/document_analysis_risk_scan.txt",
-        "summary": "legal_counsel/document_analysis_summary.txt",
-        "clause_check": "legal_counsel/document_analysis_clause_check.txt"
-    }
-
-    instruction = load_prompt(
-        analysis_instruction_files.get(
-            analysis_type,
-            analysis_instruction_files["review"]
-        )
-    )
+    system_prompt = _ANALYSIS_SYSTEM_PROMPT
+    instruction, options = _ANALYSIS_DISPATCH.get(analysis_type) or _ANALYSIS_DISPATCH["review"]
     user_prompt = f"{instruction}\n\n---\n\n{document_text}"
 
-    logger.info(f"[analyze_document] type={analysis_type}, doc_len={len(document_text)}")
+    logger.info("[analyze_document] type=%s, doc_len=%d", analysis_type, len(document_text))
 
     try:
-        response = ollama.chat(
+        response = await _aclient.chat(
             model=OLLAMA_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            options={"temperature": 0.3},
+            options=options,
         )
         content = response.get("message", {}).get("content", "")
         if not content:
             content = "I was unable to analyze the document. Please try again."
-        return {"result": content + DISCLAIMER}
+        return {"result": f"{content}{DISCLAIMER}"}
     except Exception as e:
-        logger.error(f"[analyze_document] Ollama error [{type(e).__name__}]: {repr(e)}")
+        logger.error("[analyze_document] Ollama error [%s]: %r", type(e).__name__, e)
         return {
             "result": (
                 "I encountered an error analyzing the document. "
@@ -1,25 +1,26 @@
 #!/usr/bin/env python
 # app.py - FastAPI application for Appliview agent system
 
-import os
-import json
 import asyncio
 import uuid
+import hashlib
+import hmac
 import logging
 import time
+import struct
+import orjson
+from collections import OrderedDict
+from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Header, Request, UploadFile, File
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Header, UploadFile, File, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel, Field
-from pydantic import BaseModel, EmailStr
-
-from fastapi import FastAPI, Depends, HTTPException, Header, Query, Body, WebSocket, WebSocketDisconnect
+from sse_starlette.sse import EventSourceResponse
+from pydantic import BaseModel, Field, EmailStr
 
 import pathlib
-import traceback
+from contextlib import asynccontextmanager
 
 from google.adk.agents.live_request_queue import LiveRequestQueue
 from google.adk.agents.run_config import RunConfig, StreamingMode
@@ -31,8 +32,19 @@ from lexedge.session import session_service
 from lexedge.session.firewall import session_firewall
 
 
-from lexedge.main_agent import root_agent
+from lexedge.main_agent import root_agent, create_runner
 from lexedge.utils.audio_transcription import transcribe_audio
+from lexedge.api.static_files import CachedStaticFiles
+from lexedge.tools import token_login as _tools_token_login, generate_welcome_message
+from lexedge.utils.welcome_message_sender import send_delayed_welcome_message
+from lexedge.utils.task_manager import get_task_manager
+
+# Token validation backend for /token-login, aliased so it doesn't clash
+# with the endpoint of the same name
+try:
+    from lexedge.tools.auth import token_login as _token_login_backend
+except ImportError:
+    _token_login_backend = None
 
 # Utility function for comprehensive server cleanup
 async def perform_comprehensive_cleanup(context: str = "manual"):
@@ -43,57 +55,54 @@ async def perform_comprehensive_cleanup(context: str = "manual"):
         context: String describing when this cleanup is being performed
     """
     logger.info(f"🧹 Performing comprehensive cleanup ({context})")
-    
-    # 1. Clear WebSocket connections
-    try:
+    tag = context.upper()
+
+    async def clear_websockets():
+        for writer in manager.writer_tasks.values():
+            writer.cancel()
         manager.active_connections = {}
         manager.connection_timestamps = {}
-        logger.info(f"✅ [{context.upper()}] Cleared WebSocket connections")
-    except Exception as e:
-        logger.error(f"❌ [{context.upper()}] Failed to clear WebSocket connections: {str(e)}")
-    
-    # 2. Cancel all active tasks
-    try:
-        from lexedge.utils.task_manager import get_task_manager
+        manager.send_queues = {}
+        manager.writer_tasks = {}
+        return "Cleared WebSocket connections"
+
+    async def cancel_tasks():
         task_manager = get_task_manager()
-        
-        all_active_tasks = task_manager.get_active_tasks()
-        if all_active_tasks:
-            cancelled_count = 0
-            for task_id in list(all_active_tasks.keys()):
-                if task_manager.cancel_task(task_id, f"{context} - cancelling all tasks"):
-                    cancelled_count += 1
-            
-            cleanup_count = task_manager.cleanup_completed_tasks()
-            logger.info(f"✅ [{context.upper()}] Cancelled {cancelled_count} tasks, cleaned up {cleanup_count} references")
-        else:
-            logger.info(f"✅ [{context.upper()}] No active tasks to cancel")
-            
-    except Exception as e:
-        logger.error(f"❌ [{context.upper()}] Failed to cancel active tasks: {str(e)}")
-    
-    # 3. Clear all sessions from database
-    try:
+
+        cancelled_count = task_manager.cancel_all(f"{context} - cancelling all tasks")
+        cleanup_count = task_manager.cleanup_completed_tasks()
+        return f"Cancelled {cancelled_count} tasks, cleaned up {cleanup_count} references"
+
+    async def clear_sessions():
         session_count = await session_service.clear_all_sessions()
-        logger.info(f"✅ [{context.upper()}] Cleared {session_count} sessions from database")
-    except Exception as e:
-        logger.error(f"❌ [{context.upper()}] Failed to clear sessions: {str(e)}")
-    
-    # 4. Reset session firewall
-    try:
+        return f"Cleared {session_count} sessions from database"
+
+    async def reset_firewall():
         session_firewall.reset()
-        logger.info(f"✅ [{context.upper()}] Reset session firewall")
-    except Exception as e:
-        logger.error(f"❌ [{context.upper()}] Failed to reset session firewall: {str(e)}")
-    
-    # 5. Clear any cached data in tools/utilities
-    try:
+        return "Reset session firewall"
+
+    async def clear_cached_data():
         # Clear suggestion cache if it exists (from tools.py)
-        logger.info(f"✅ [{context.upper()}] Reset cached data")
-    except Exception as e:
-        logger.error(f"❌ [{context.upper()}] Failed to clear cached data: {str(e)}")
+        return "Reset cached data"
+
+    # The steps are independent, so they run together: the database clear
+    # proceeds in a worker thread while the in-memory resets complete, and
+    # one failing step doesn't stop the others
+    steps = {
+        "clear WebSocket connections": clear_websockets(),
+        "cancel active tasks": cancel_tasks(),
+        "clear sessions": clear_sessions(),
+        "reset session firewall": reset_firewall(),
+        "clear cached data": clear_cached_data(),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ [{tag}] Failed to {step}: {str(result)}")
+        else:
+            logger.info(f"✅ [{tag}] {result}")
     
-    logger.info(f"🎯 [{context.upper()}] Comprehensive cleanup completed!")
+    logger.info(f"🎯 [{tag}] Comprehensive cleanup completed!")
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -102,55 +111,67 @@ logger = logging.getLogger(__name__)
 CURRENT_DIR = pathlib.Path(__file__).parent.resolve()
 STATIC_DIR = CURRENT_DIR / "static"
 
-# Create FastAPI app
-app = FastAPI(
-    title="LexEdge Legal AI API",
-    description="API for interacting with the LexEdge Legal AI agent system through HTTP and WebSockets",
-    version="1.0.0"
-)
-
-# Include HTMX web routes
-try:
-    from lexedge.web.routes import router as web_router
-    app.include_router(web_router)
-except ImportError as e:
-    logger.warning(f"Web routes not available: {e}")
-
-# FastAPI startup and shutdown events for comprehensive cleanup
-@app.on_event("startup")
+# Startup and shutdown hooks for comprehensive cleanup, run by the app lifespan
 async def startup_event():
     """FastAPI startup event - ensures cleanup runs even if server started directly with uvicorn"""
     logger.info("🔄 FastAPI startup event triggered")
+    # Ensure the static directory exists before StaticFiles serves from it
+    if not STATIC_DIR.exists():
+        STATIC_DIR.mkdir(parents=True, exist_ok=True)
     await perform_comprehensive_cleanup("startup event")
     session_firewall.start_cleanup_task()
+    # Cached clock for WebSocket message timestamps
+    start_clock()
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """FastAPI shutdown event - cleanup on server shutdown"""
     logger.info("🛑 FastAPI shutdown event triggered")
     
     try:
         # Additional shutdown-specific cleanup
-        from lexedge.utils.task_manager import get_task_manager
         task_manager = get_task_manager()
         
-        all_active_tasks = task_manager.get_active_tasks()
-        if all_active_tasks:
-            cancelled_count = 0
-            for task_id in list(all_active_tasks.keys()):
-                if task_manager.cancel_task(task_id, "Server shutdown - cancelling all tasks"):
-                    cancelled_count += 1
+        cancelled_count = task_manager.cancel_all("Server shutdown - cancelling all tasks")
+        if cancelled_count:
             logger.info(f"✅ [SHUTDOWN EVENT] Cancelled {cancelled_count} tasks")
         
         # Shutdown session firewall properly
         session_firewall.shutdown()
         logger.info("✅ [SHUTDOWN EVENT] Session firewall shutdown")
         
+        stop_clock()
+        
     except Exception as e:
         logger.error(f"❌ [SHUTDOWN EVENT] Error during shutdown cleanup: {str(e)}")
     
     # Run general cleanup too
-    perform_comprehensive_cleanup("shutdown event")
+    await perform_comprehensive_cleanup("shutdown event")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run startup cleanup before serving and shutdown cleanup once serving stops."""
+    await startup_event()
+    try:
+        yield
+    finally:
+        await shutdown_event()
+
+# Create FastAPI app
+app = FastAPI(
+    title="LexEdge Legal AI API",
+    description="API for interacting with the LexEdge Legal AI agent system through HTTP and WebSockets",
+    version="1.0.0",
+    lifespan=lifespan,
+    # Serialize endpoint results with orjson instead of stdlib json
+    default_response_class=ORJSONResponse
+)
+
+# Include HTMX web routes
+try:
+    from lexedge.web.routes import router as web_router
+    app.include_router(web_router)
+except ImportError as e:
+    logger.warning(f"Web routes not available: {e}")
 
 # Add CORS middleware to allow cross-origin requests
 app.add_middleware(
@@ -159,43 +180,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browsers cache preflight results; the middleware answers
+    # preflight requests itself before routing
+    max_age=3600,
 )
 
-# Add explicit OPTIONS handler for preflight requests
-@app.options("/{path:path}")
-async def options_handler(request: Request, path: str):
-    # Set proper CORS headers for preflight requests
-    headers = {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": "POST, GET, DELETE, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization, Accept",
-        "Access-Control-Max-Age": "3600"
-    }
-    
-    return JSONResponse(
-        status_code=200,
-        content={"detail": "OK"},
-        headers=headers
-    )
-
 # Audio transcription proxy (convert to WAV + retry)
 @app.post("/audio/transcribe")
 async def transcribe_audio_endpoint(file: UploadFile = File(...)):
     try:
-        audio_bytes = await file.read()
-        result = transcribe_audio(
-            audio_bytes,
+        # The upload is already spooled to a temp file by Starlette; hand that
+        # file to a worker thread so conversion and the blocking ASR request
+        # don't stall the event loop or copy the whole upload into memory
+        await file.seek(0)
+        result = await asyncio.to_thread(
+            transcribe_audio,
+            file.file,
             filename=file.filename or "audio.webm",
             content_type=file.content_type
         )
-        return JSONResponse(status_code=200, content=result)
+        return ORJSONResponse(status_code=200, content=result)
     except Exception as exc:
         logger.error(f"Audio transcription failed: {exc}")
         raise HTTPException(status_code=500, detail=str(exc))
 
-# Mount static files
-os.makedirs(STATIC_DIR, exist_ok=True)  # Ensure static directory exists
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# Mount static files; the directory is created on startup, so skip the
+# import-time existence check. Small assets are served from memory after
+# their first request
+app.mount(
+    "/static",
+    CachedStaticFiles(directory=str(STATIC_DIR), check_dir=False, html=False, follow_symlink=False),
+    name="static"
+)
 
 # ----- Pydantic Models for API -----
 
@@ -274,11 +290,84 @@ class LoginResponse(BaseModel):
     capabilities_overview: Dict[str, Any] = None
     quick_start_suggestions: List[Dict[str, Any]] = None
 
+# Demo tenant accepted by validate_token
+DEMO_TENANT_ID = "test"
+
+# Successful token validations from /token-login, so repeat logins within the
+# TTL skip the upstream validation. Keys hold a digest, never the raw token,
+# and failures are not cached.
+TOKEN_VALIDATION_TTL = 300
+TOKEN_VALIDATION_CACHE_SIZE = 256
+_token_validation_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+def _token_validation_key(login_data: "TokenLoginRequest") -> tuple:
+    """Cache key for a login request: its identifiers plus a token digest."""
+    token_hash = hashlib.blake2b(login_data.token.encode("utf-8"), digest_size=16).digest()
+    return (
+        login_data.user_id,
+        login_data.tenant_id,
+        login_data.tenant_admin_id,
+        login_data.role_id,
+        token_hash,
+    )
+
+def _get_cached_token_validation(key: tuple) -> Optional[Dict[str, Any]]:
+    """Return a still-fresh cached validation result, dropping expired ones.
+
+    A hit marks the entry as most recently used, so eviction is LRU.
+    """
+    entry = _token_validation_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, result = entry
+    if expires_at < time.monotonic():
+        del _token_validation_cache[key]
+        return None
+    _token_validation_cache.move_to_end(key)
+    return result
+
+def _token_seconds_left(token_expiry: Any) -> Optional[float]:
+    """Seconds until a token_expiry (epoch seconds or ISO-8601) passes, if parseable."""
+    if isinstance(token_expiry, (int, float)) and not isinstance(token_expiry, bool):
+        expires_at = float(token_expiry)
+    elif isinstance(token_expiry, str) and token_expiry:
+        try:
+            expires_at = float(token_expiry)
+        except ValueError:
+            try:
+                parsed = datetime.fromisoformat(token_expiry.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            expires_at = parsed.timestamp()
+    else:
+        return None
+    return expires_at - time.time()
+
+def _cache_token_validation(key: tuple, result: Dict[str, Any]) -> None:
+    """Remember a successful validation, evicting the oldest entry when full.
+
+    Entries never outlive the token itself: the TTL is capped at the
+    token_expiry the backend reported, and already-expired tokens are skipped.
+    """
+    ttl = TOKEN_VALIDATION_TTL
+    seconds_left = _token_seconds_left((result.get("data") or {}).get("token_expiry"))
+    if seconds_left is not None:
+        if seconds_left <= 0:
+            return
+        ttl = min(ttl, seconds_left)
+    _token_validation_cache[key] = (time.monotonic() + ttl, result)
+    _token_validation_cache.move_to_end(key)
+    if len(_token_validation_cache) > TOKEN_VALIDATION_CACHE_SIZE:
+        _token_validation_cache.popitem(last=False)
+
 @app.post("/api/v1/jobs/validate-token", response_model=TokenValidationResponse)
 async def validate_token(request: TokenValidationRequest, x_tenant_id: str = Header(...), x_tenant_token: str = Header(...)):
     # Simple validation for demonstration purposes
     # In a real application, you would validate the token against a database or auth service
-    if x_tenant_id == "test" and len(x_tenant_token) > 10: # Basic check
+    # compare_digest keeps the comparison time independent of where the ids differ
+    if hmac.compare_digest(x_tenant_id.encode("utf-8"), DEMO_TENANT_ID.encode("utf-8")) and len(x_tenant_token) > 10: # Basic check
         return TokenValidationResponse(
             status="success",
             data={
@@ -302,17 +391,28 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
     information including a session_id with the actual tenant information.
     """
     try:
-        # Import the token_login function from tools to validate the token
-        from lexedge.tools.auth import token_login 
-        
-        # Validate the token using the backend validation service
-        validation_result = token_login(
-            user_id=login_data.user_id,
-            tenant_id=login_data.tenant_id,
-            tenant_admin_id=login_data.tenant_admin_id,
-            role_id=login_data.role_id,
-            token=login_data.token
-        )
+        cache_key = _token_validation_key(login_data)
+        validation_result = _get_cached_token_validation(cache_key)
+        if validation_result is None:
+            if _token_login_backend is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Token login failed: token validation backend is not available"
+                )
+            
+            # Validate the token using the backend validation service; the
+            # call is blocking I/O, so it runs in a worker thread and other
+            # requests keep being served while it waits
+            validation_result = await asyncio.to_thread(
+                _token_login_backend,
+                user_id=login_data.user_id,
+                tenant_id=login_data.tenant_id,
+                tenant_admin_id=login_data.tenant_admin_id,
+                role_id=login_data.role_id,
+                token=login_data.token
+            )
+            if validation_result.get("status") == "success":
+                _cache_token_validation(cache_key, validation_result)
         
         logger.info(f"Token validation result: {validation_result}")
         
@@ -383,7 +483,7 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
         logger.info(f"Created new token-based session {session_id} for user {login_data.user_id} with user name {user_name}")
         
         # Return login response with validated data
-        return LoginResponse(
+        return LoginResponse.model_construct(
             tenant_id=validated_tenant_id,
             token=login_data.token,
             name=user_name,  # Use actual user name from validation
@@ -412,9 +512,17 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
 
 # ----- WebSocket Connection Manager -----
 
-from lexedge.utils.websocket_manager import manager
+from lexedge.utils.websocket_manager import manager, cached_time, start_clock, stop_clock
 # manager is now imported from lexedge.utils.websocket_manager
 
+# Heartbeat replies have a fixed shape, so they are formatted straight into
+# JSON text; a float's repr is valid JSON
+_PONG_TEMPLATE = '{"type":"pong","timestamp":%r}'
+_SYSTEM_ACK_TEMPLATE = '{"type":"ack","message":"System message received","timestamp":%r}'
+
+# Client keepalive/control messages, matched on "type" or on the query text
+SYSTEM_MESSAGE_TYPES = frozenset({"ping", "heartbeat", "heartbeat_ack", "connection", "pong"})
+
 # ----- HTTP Routes -----
 
 @app.get("/")
@@ -441,8 +549,9 @@ async def create_session(session_data: SessionCreate):
             state=initial_state
         )
         
-        # Return session information
-        return SessionResponse(
+        # Return session information; the values come from the session
+        # service, so skip re-validating them here
+        return SessionResponse.model_construct(
             session_id=session.id,
             user_id=session_data.user_id,
             app_name=session_data.app_name,
@@ -462,7 +571,7 @@ async def get_session(session_id: str, user_id: str, app_name: str = "lexedge"):
             session_id=session_id
         )
         
-        return SessionResponse(
+        return SessionResponse.model_construct(
             session_id=session.id,
             user_id=user_id,
             app_name=app_name,
@@ -481,16 +590,18 @@ async def list_sessions(user_id: Optional[str] = None, app_name: Optional[str] =
             app_name=app_name
         )
         
-        return [
-            SessionResponse(
-                session_id=session.id,
-                user_id=session.user_id,
-                app_name=session.app_name,
-                state=session.state,
-                last_update_time=session.last_update_time
-            )
+        # Rows come straight from the session store, so serialize them
+        # directly instead of validating one SessionResponse per session
+        return ORJSONResponse([
+            {
+                "session_id": session.id,
+                "user_id": session.user_id,
+                "app_name": session.app_name,
+                "state": session.state,
+                "last_update_time": session.last_update_time
+            }
             for session in sessions
-        ]
+        ])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list sessions: {str(e)}")
 
@@ -506,7 +617,7 @@ async def query_agent(query_data: AgentQuery):
         )
         
         # Return only what's in the AgentResponse model
-        return AgentResponse(
+        return AgentResponse.model_construct(
             session_id=result["session_id"],
             response=result["response"],
             formatted_response=result.get("formatted_response"),
@@ -521,10 +632,29 @@ async def query_agent(query_data: AgentQuery):
             login_error_type=result.get("login_error_type", "")
         )
     except Exception as e:
-        logger.error(f"Agent query failed: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Agent query failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Agent query failed: {str(e)}")
 
+def _sse_frame(payload: Dict[str, Any]) -> bytes:
+    """Encode payload as one SSE data frame (UTF-8 JSON, non-ASCII unescaped)."""
+    return b"data: %b\n\n" % orjson.dumps(payload)
+
+# Seconds between keepalive comments on an idle SSE stream
+SSE_PING_INTERVAL = 15
+
+# Control frames never change, so they are encoded once
+_SSE_CONNECTION_ESTABLISHED = _sse_frame({"type": "connection_established"})
+_SSE_STREAM_COMPLETE = _sse_frame({"type": "stream_complete"})
+_SSE_STREAM_ENDED = _sse_frame({"type": "stream_ended"})
+
+# Response headers for /agent/stream; EventSourceResponse copies them into
+# its own header set, so one shared mapping serves every request
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*"
+}
+
 @app.post("/agent/stream")
 async def stream_agent(query_data: StreamQuery):
     """
@@ -533,10 +663,12 @@ async def stream_agent(query_data: StreamQuery):
     This endpoint is designed for streaming real-time notifications and alerts
     from the Appliview agent.
     """
-    async def event_generator():
+    # The generator isn't a route, so its defaults are free to bind the
+    # per-chunk helpers as fast locals for the streaming loop
+    async def event_generator(_frame=_sse_frame, _stream_complete=_SSE_STREAM_COMPLETE):
         try:
             # Start with a connection established message
-            yield "data: " + json.dumps({"type": "connection_established"}) + "\n\n"
+            yield _SSE_CONNECTION_ESTABLISHED
             
             # Stream responses from the agent
             async for chunk in stream_agent_response(
@@ -546,34 +678,32 @@ async def stream_agent(query_data: StreamQuery):
                 app_name=query_data.app_name
             ):
                 # Format as SSE event
-                yield "data: " + json.dumps(chunk) + "\n\n"
+                yield _frame(chunk)
                 
                 # If this is the final response in a stream, send a completion event
                 if chunk.get("stream_complete", False):
-                    yield "data: " + json.dumps({"type": "stream_complete"}) + "\n\n"
+                    yield _stream_complete
                     
             # Add a final event to indicate the stream is done
-            yield "data: " + json.dumps({"type": "stream_ended"}) + "\n\n"
+            yield _SSE_STREAM_ENDED
             
         except Exception as e:
-            logger.error(f"Error during streaming: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error during streaming: %s", e)
             # Send error as SSE event
-            yield "data: " + json.dumps({
+            yield _sse_frame({
                 "type": "error",
                 "error": str(e)
-            }) + "\n\n"
+            })
     
-    # Return streaming response with proper headers for SSE
-    return StreamingResponse(
+    # Return an SSE response: frames are pre-encoded bytes and pass through
+    # as-is, idle streams get a keepalive comment every 15s so proxies don't
+    # drop them, and a client disconnect cancels the generator (and with it
+    # the agent run)
+    return EventSourceResponse(
         event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream",
-            "Access-Control-Allow-Origin": "*"
-        }
+        ping=SSE_PING_INTERVAL,
+        sep="\n",
+        headers=_SSE_HEADERS
     )
 
 @app.delete("/sessions/{session_id}")
@@ -594,6 +724,61 @@ async def delete_session(session_id: str, user_id: str, app_name: str = "lexedge
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Failed to delete session: {str(e)}")
 
+async def _do_logout(user_id: str, session_id: str, app_name: str):
+    """Tear down a session after logout; each step runs even if an earlier one fails"""
+    # Process a logout request through the agent to clear all data
+    try:
+        result = await run_agent(
+            user_id=user_id,
+            query="logout",
+            session_id=session_id,
+            app_name=app_name
+        )
+        logger.info(f"Logout agent completed: {result.get('response', 'No response')}")
+    except Exception as e:
+        logger.warning(f"Error running logout agent command: {str(e)}")
+    
+    async def unregister_firewall():
+        session_firewall.unregister_session(session_id)
+        return f"Unregistered session {session_id} from firewall"
+
+    async def delete_db_session():
+        await session_service.delete_session(
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id
+        )
+        return f"Successfully deleted session {session_id} from database"
+
+    async def disconnect_websocket():
+        # If there is an active WebSocket mapped to this session, close and disconnect it to avoid stale connections
+        conn_id = manager.session_connections.get(session_id)
+        if not conn_id:
+            return f"No WebSocket connection for session {session_id}"
+        logger.info(f"Disconnecting WebSocket connection {conn_id} for logged out session {session_id}")
+        websocket = manager.active_connections.get(conn_id)
+        if websocket is not None:
+            try:
+                await asyncio.wait_for(websocket.close(code=1000, reason="Logged out"), timeout=1.0)
+            except Exception as close_err:
+                logger.warning(f"Could not close WebSocket {conn_id} gracefully: {close_err}")
+        manager.disconnect(conn_id)
+        return f"Disconnected WebSocket connection {conn_id}"
+
+    # The remaining steps are independent, so they run together: the database
+    # delete proceeds in a worker thread while the socket closes
+    steps = {
+        "unregister session from firewall": unregister_firewall(),
+        "delete session from database": delete_db_session(),
+        "disconnect WebSocket": disconnect_websocket(),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to {step} for session {session_id}: {str(result)}")
+        else:
+            logger.info(result)
+
 @app.post("/logout")
 async def logout(session_id: str, user_id: str, app_name: str = "lexedge"):
     """Logout a user and invalidate their session, clearing all session data"""
@@ -608,40 +793,8 @@ async def logout(session_id: str, user_id: str, app_name: str = "lexedge"):
         except Exception as e:
             raise HTTPException(status_code=404, detail=f"Session not found: {str(e)}")
         
-        # Process a logout request through the agent to clear all data
-        try:
-            result = await run_agent(
-                user_id=user_id,
-                query="logout",
-                session_id=session_id,
-                app_name=app_name
-            )
-            logger.info(f"Logout agent completed: {result.get('response', 'No response')}")
-        except Exception as e:
-            logger.warning(f"Error running logout agent command: {str(e)}")
-        
-        # Unregister from session firewall first
-        session_firewall.unregister_session(session_id)
-        
-        # Delete the session entirely from the database
-        try:
-            await session_service.delete_session(
-                app_name=app_name,
-                user_id=user_id,
-                session_id=session_id
-            )
-            logger.info(f"Successfully deleted session {session_id} from database")
-        except Exception as e:
-            logger.error(f"Error deleting session from database: {str(e)}")
-        
-        # If there is an active WebSocket mapped to this session, disconnect it to avoid stale connections
-        try:
-            if session_id in manager.session_connections:
-                conn_id = manager.session_connections.get(session_id)
-                logger.info(f"Disconnecting WebSocket connection {conn_id} for logged out session {session_id}")
-                manager.disconnect(conn_id)
-        except Exception as disconnect_err:
-            logger.warning(f"Failed to disconnect WebSocket for session {session_id}: {disconnect_err}")
+        # Run the teardown shielded so a client disconnect can't stop it partway
+        await asyncio.shield(_do_logout(user_id, session_id, app_name))
         
         return {
             "message": f"User {user_id} logged out successfully and all session data cleared", 
@@ -671,22 +824,18 @@ async def get_chat_history(session_id: str, user_id: str, app_name: str = "lexed
         except Exception as direct_error:
             logger.warning(f"Couldn't get session directly: {str(direct_error)}")
             
-            # If direct lookup fails and we have auth_user_name, try to find by looking at all sessions
+            # If direct lookup fails and we have auth_user_name, look the session up by ID alone
             if auth_user_name:
                 logger.info(f"Trying to find session by auth_user_name: {auth_user_name}")
                 try:
-                    # Get all sessions
-                    all_sessions = await session_service.list_sessions(app_name=app_name)
-                    
-                    # Look for the specific session ID
-                    for s in all_sessions:
-                        if s.id == session_id:
-                            # Found the session
-                            session = s
-                            logger.info(f"Found session {session_id} by scanning all sessions")
-                            break
-                except Exception as list_error:
-                    logger.error(f"Error listing all sessions: {str(list_error)}")
+                    session = await session_service.get_session_by_id(
+                        app_name=app_name,
+                        session_id=session_id
+                    )
+                    if session:
+                        logger.info(f"Found session {session_id} by session ID lookup")
+                except Exception as lookup_error:
+                    logger.error(f"Error looking up session by ID: {str(lookup_error)}")
         
         if not session:
             raise HTTPException(status_code=404, detail=f"Session not found")
@@ -694,29 +843,32 @@ async def get_chat_history(session_id: str, user_id: str, app_name: str = "lexed
         # Don't filter by auth_user_name if provided
         # This allows viewing any session as long as they have the session ID
         
+        # Bind the state once; every field below is read from it
+        state = session.state or {}
+        
         # Extract conversation history from session state
         conversation_history = []
-        if session.state and "interaction_history" in session.state:
-            # Get the conversation history
-            history = session.state["interaction_history"]
-            
-            # Filter out messages with empty content
+        history = state.get("interaction_history") or []
+        if history:
+            # Filter out messages with empty or whitespace-only content;
+            # isspace() checks in place instead of building a stripped copy
             conversation_history = [
-                msg for msg in history 
-                if msg.get("content") and msg.get("content").strip()
+                msg for msg in history
+                if (content := msg.get("content")) and not content.isspace()
             ]
             
             # Log the filtering results
-            if len(history) != len(conversation_history):
-                logger.info(f"Filtered out {len(history) - len(conversation_history)} empty messages from chat history")
+            dropped = len(history) - len(conversation_history)
+            if dropped:
+                logger.info(f"Filtered out {dropped} empty messages from chat history")
         
         return {
             "session_id": session.id,
             "user_id": session.user_id,
             "auth_info": {
-                "is_authenticated": session.state.get("is_authenticated", False),
-                "user_name": session.state.get("user_name", ""),
-                "role": session.state.get("role", "")
+                "is_authenticated": state.get("is_authenticated", False),
+                "user_name": state.get("user_name", ""),
+                "role": state.get("role", "")
             },
             "conversation_history": conversation_history
         }
@@ -727,6 +879,22 @@ async def get_chat_history(session_id: str, user_id: str, app_name: str = "lexed
         logger.error(f"Failed to retrieve chat history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve chat history: {str(e)}")
 
+# The only session state entries /user-chat-history reports
+_HISTORY_STATE_KEYS = ("interaction_history", "is_authenticated", "user_name", "role")
+
+def _visible_messages(raw_history: Any) -> List[Dict[str, Any]]:
+    """Drop history entries without displayable text content."""
+    if not raw_history:
+        return []
+    # Type checks instead of a try per session: a malformed entry is dropped
+    # on its own rather than taking the rest of its session with it
+    return [
+        msg for msg in raw_history
+        if isinstance(msg, dict)
+        and isinstance(content := msg.get("content"), str)
+        and content and not content.isspace()
+    ]
+
 @app.get("/user-chat-history")
 async def get_user_chat_history(user_id: str, app_name: str = "lexedge", auth_user_name: Optional[str] = None):
     """Get all chat sessions and their history for a user
@@ -738,21 +906,13 @@ async def get_user_chat_history(user_id: str, app_name: str = "lexedge", auth_us
     try:
         logger.info(f"Fetching chat history for user_id: {user_id}, auth_user_name: {auth_user_name}, app: {app_name}")
         
-        # Directly get sessions for this user_id from the database
-        logger.debug(f"Fetching sessions directly by user_id={user_id}")
-        sessions = await session_service.list_sessions(app_name=app_name, user_id=user_id)
-        logger.info(f"Found {len(sessions)} sessions directly matching user_id={user_id}")
-        
-        # If no sessions found, try to get all sessions and filter manually
-        if not sessions:
-            logger.debug("No sessions found by direct query, trying manual filtering")
-            all_sessions = await session_service.list_sessions(app_name=app_name)
-            logger.info(f"Found {len(all_sessions)} total sessions across all users")
-            
-            # Filter manually
-            for session in all_sessions:
-                if session.user_id == user_id:
-                    sessions.append(session)
+        # Get sessions for this user_id straight from the database; the query
+        # filters on (app_name, user_id), so there is nothing left to scan for
+        sessions = await session_service.list_sessions_by_user(
+            app_name=app_name,
+            user_id=user_id,
+            state_keys=_HISTORY_STATE_KEYS
+        )
         
         if not sessions:
             logger.warning(f"No sessions found for user {user_id}")
@@ -764,78 +924,76 @@ async def get_user_chat_history(user_id: str, app_name: str = "lexedge", auth_us
         
         logger.info(f"Found {len(sessions)} total sessions for user {user_id}")
         
-        # Process all valid sessions
-        sessions_history = []
-        for session in sessions:
-            try:
-                # Skip sessions with None state
-                if not session or not hasattr(session, 'state') or session.state is None:
-                    logger.warning(f"Skipping invalid session {getattr(session, 'id', 'unknown')}, missing or invalid state")
-                    continue
-                
-                # Get the raw conversation history
-                conversation_history = []
-                if "interaction_history" in session.state:
-                    raw_history = session.state["interaction_history"]
-                    
-                    # Filter out messages with empty content
-                    conversation_history = [
-                        msg for msg in raw_history 
-                        if msg.get("content") and msg.get("content").strip()
-                    ]
-                    
-                    # Log the filtering results
-                    if len(raw_history) != len(conversation_history):
-                        logger.info(f"Filtered out {len(raw_history) - len(conversation_history)} empty messages from session {session.id}")
-                
-                # Get authentication info
-                is_authenticated = session.state.get("is_authenticated", False)
-                session_user_name = session.state.get("user_name", "")
-                
-                auth_info = {
-                    "is_authenticated": is_authenticated,
-                    "user_name": session_user_name,
+        # The store always hands back a state dict (the projection yields {} for
+        # sessions without the keys), so every session can be mapped directly
+        sessions_history = [
+            {
+                "session_id": session.id,
+                "client_user_id": session.user_id,
+                "last_update_time": session.last_update_time,
+                "conversation_history": _visible_messages(session.state.get("interaction_history")),
+                "auth_info": {
+                    "is_authenticated": session.state.get("is_authenticated", False),
+                    "user_name": session.state.get("user_name", ""),
                     "role": session.state.get("role", "")
                 }
-                
-                # Add the session to the response
-                logger.info(f"Adding session {session.id} to history response with {len(conversation_history)} messages")
-                
-                sessions_history.append({
-                    "session_id": session.id,
-                    "client_user_id": session.user_id,
-                    "last_update_time": session.last_update_time,
-                    "conversation_history": conversation_history,
-                    "auth_info": auth_info
-                })
-            except Exception as e:
-                # Log error but continue processing other sessions
-                logger.error(f"Error processing session {getattr(session, 'id', 'unknown')}: {str(e)}")
-                continue
-        
-        # Sort sessions by last update time (newest first)
-        sessions_history.sort(key=lambda x: x["last_update_time"], reverse=True)
+            }
+            for session in sessions
+        ]
         
+        # Sessions are already newest-first: the query orders by updated_at
         logger.info(f"Returning {len(sessions_history)} sessions in history response")
         
-        return {
+        # Everything here is JSON loaded from the store, so hand it to orjson
+        # directly rather than letting FastAPI walk every message first
+        return ORJSONResponse({
             "client_user_id": user_id,
             "authenticated_user_name": auth_user_name,
             "sessions": sessions_history
-        }
+        })
     except Exception as e:
         logger.error(f"Failed to retrieve user chat history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve user chat history: {str(e)}")
 
+# Demo pages are kept in memory and re-read only when the file changes; the
+# mtime is rechecked at most once per STATIC_HTML_RECHECK_INTERVAL seconds
+STATIC_HTML_RECHECK_INTERVAL = 5.0
+_static_html_cache: Dict[str, tuple] = {}  # {name: (checked_at, mtime, html)}
+
+def _read_static_html(name: str, entry: Optional[tuple]) -> Optional[tuple]:
+    """Stat STATIC_DIR/name and return (mtime, html), re-reading only if the
+    mtime differs from the cached entry; None if the file doesn't exist."""
+    path = STATIC_DIR / name
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    if entry is not None and entry[1] == mtime:
+        return mtime, entry[2]
+    return mtime, path.read_text()
+
+async def _static_html(name: str) -> Optional[str]:
+    """Return the contents of STATIC_DIR/name, or None if it doesn't exist."""
+    now = time.monotonic()
+    entry = _static_html_cache.get(name)
+    if entry is not None and now - entry[0] < STATIC_HTML_RECHECK_INTERVAL:
+        return entry[2]
+    
+    # The stat (and any re-read) is disk I/O, so it runs off the event loop
+    loaded = await asyncio.to_thread(_read_static_html, name, entry)
+    if loaded is None:
+        _static_html_cache.pop(name, None)
+        return None
+    mtime, html = loaded
+    _static_html_cache[name] = (now, mtime, html)
+    return html
+
 # Add a dedicated route for the WebSocket demo client
 @app.get("/demo", response_class=HTMLResponse)
 async def demo():
     """WebSocket demo client"""
-    # Check if index.html exists
-    index_path = STATIC_DIR / "index.html"
-    if index_path.exists():
-        with open(index_path, "r") as f:
-            html_content = f.read()
+    html_content = await _static_html("index.html")
+    if html_content is not None:
         return html_content
     else:
         return "<html><body><h1>Demo client not found</h1></body></html>"
@@ -877,8 +1035,7 @@ async def logout_user(query_data: AgentQuery):
             login_error_type=result.get("login_error_type", "")
         )
     except Exception as e:
-        logger.error(f"Logout failed: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Logout failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Logout failed: {str(e)}")
 
 class LoginRequest(BaseModel):
@@ -917,6 +1074,18 @@ API_TOKEN = "test-token-abc-xyz-789"
 TEST_EMAIL = "user@example.com"
 TEST_PASSWORD = "password123"
 TEST_NAME = "Test User"
+_TEST_EMAIL_BYTES = TEST_EMAIL.encode("utf-8")
+_TEST_PASSWORD_BYTES = TEST_PASSWORD.encode("utf-8")
+# Maps an email to the user_id suffix the WebSocket client derives ('@' and '.' -> '_')
+_EMAIL_TO_USER_ID = str.maketrans({"@": "_", ".": "_"})
+
+def _check_test_credentials(email: str, password: str) -> bool:
+    """Constant-time check of the hardcoded test credentials"""
+    # Compare both fields unconditionally so timing doesn't reveal which one failed
+    email_ok = hmac.compare_digest(email.encode("utf-8"), _TEST_EMAIL_BYTES)
+    password_ok = hmac.compare_digest(password.encode("utf-8"), _TEST_PASSWORD_BYTES)
+    return email_ok & password_ok
+
 # New login endpoint
 @app.post("/login", response_model=LoginResponse, summary="User Login", tags=["Authentication"])
 async def login(login_data: LoginRequest = Body(...)):
@@ -933,7 +1102,7 @@ async def login(login_data: LoginRequest = Body(...)):
     - Email: user@example.com
     - Password: password123
     """
-    if login_data.email != TEST_EMAIL or login_data.password != TEST_PASSWORD:
+    if not _check_test_credentials(login_data.email, login_data.password):
         raise HTTPException(
             status_code=401,
             detail="Invalid email or password"
@@ -968,7 +1137,7 @@ async def direct_login(login_data: LoginRequest = Body(...)):
     - Email: user@example.com
     - Password: password123
     """
-    if login_data.email != TEST_EMAIL or login_data.password != TEST_PASSWORD:
+    if not _check_test_credentials(login_data.email, login_data.password):
         raise HTTPException(
             status_code=401,
             detail="Invalid email or password"
@@ -976,7 +1145,7 @@ async def direct_login(login_data: LoginRequest = Body(...)):
     
     # Use a consistent user_id format - match what the frontend is sending to WebSocket
     # Important: This must exactly match the format used by the client WebSocket
-    user_id = f"user_{login_data.email.replace('@', '_').replace('.', '_')}"
+    user_id = "user_" + login_data.email.translate(_EMAIL_TO_USER_ID)
     logger.info(f"Login: Using consistent user_id: {user_id}")
     
     # Create a new session or get existing one for the user
@@ -993,24 +1162,21 @@ async def direct_login(login_data: LoginRequest = Body(...)):
             session = max(sessions, key=lambda s: s.last_update_time)
             session_id = session.id
             
-            # Update the session state to ensure authentication info is present
-            session.state.update({
-                "user_name": TEST_NAME,
-                "user_id": user_id,
-                "is_authenticated": True,
-                "token": API_TOKEN,
-                "tenant_id": TENANT_ID,
-                "tenant_name": "Test Tenant",
-                "role": "admin",
-                "is_admin": True
-            })
-            
-            # Save the updated session
-            await session_service.create_session(
+            # Merge the authentication info into the stored state in one UPDATE
+            await session_service.merge_session_state(
                 app_name="lexedge",
                 user_id=user_id,
                 session_id=session_id,
-                state=session.state
+                state_patch={
+                    "user_name": TEST_NAME,
+                    "user_id": user_id,
+                    "is_authenticated": True,
+                    "token": API_TOKEN,
+                    "tenant_id": TENANT_ID,
+                    "tenant_name": "Test Tenant",
+                    "role": "admin",
+                    "is_admin": True
+                }
             )
             
             # Record activity to prevent session expiration
@@ -1069,11 +1235,13 @@ async def validate_session(session_id: str):
     Client should call this on page load before trying to connect WebSocket.
     """
     try:
-        # Try to find the session
-        sessions = await session_service.list_sessions(app_name="lexedge")
-        session_exists = any(s.id == session_id for s in sessions)
+        # Look the session up by its primary key
+        session = await session_service.get_session_by_id(
+            app_name="lexedge",
+            session_id=session_id
+        )
         
-        if session_exists:
+        if session is not None:
             return {"valid": True, "session_id": session_id}
         else:
             return {"valid": False, "session_id": session_id, "error": "Session not found or expired"}
@@ -1091,11 +1259,10 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
     information including a session_id with the actual tenant information.
     """
     try:
-        # Import the token_login function from tools to validate the token
-        from lexedge.tools import token_login 
-        
-        # Validate the token using the backend validation service
-        validation_result = token_login(
+        # Validate the token using the backend validation service in a
+        # worker thread so the blocking call doesn't stall the event loop
+        validation_result = await asyncio.to_thread(
+            _tools_token_login,
             user_id=login_data.user_id,
             tenant_id=login_data.tenant_id,
             tenant_admin_id=login_data.tenant_admin_id,
@@ -1173,8 +1340,6 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
         
         # Send immediate welcome message via WebSocket
         try:
-            from lexedge.utils.welcome_message_sender import send_delayed_welcome_message
-            
             welcome_session_data = {
                 'session_id': session_id,
                 'user_id': login_data.user_id,
@@ -1226,8 +1391,6 @@ async def token_login(login_data: TokenLoginRequest = Body(...)):
 async def test_welcome_message():
     """Test endpoint to demonstrate welcome message generation"""
     try:
-        from lexedge.tools import generate_welcome_message
-        
         # Test with sample data
         test_user_name = "Chirag"
         test_tenant_name = "Test Company"
@@ -1298,16 +1461,11 @@ async def websocket_endpoint(
         logger.info(f"[WEBSOCKET] Connection attempt for session: {session_id}, tenant: {tenant_id}")
         
         try:
-            # Get session from database
-            # Note: We need to get the session to validate it exists
-            # For now, we'll list all sessions and find the matching one
-            all_sessions = await session_service.list_sessions(app_name="lexedge")
-            session = None
-            
-            for s in all_sessions:
-                if s.id == session_id:
-                    session = s
-                    break
+            # Get session from database by its primary key to validate it exists
+            session = await session_service.get_session_by_id(
+                app_name="lexedge",
+                session_id=session_id
+            )
             
             if not session:
                 if session_id == "demo_session":
@@ -1371,67 +1529,67 @@ async def websocket_endpoint(
             "session_id": session_id,
             "tenant_id": final_tenant_id,
             "connection_id": connection_id,
-            "timestamp": time.time()
+            "timestamp": cached_time()
         })
         
         # Step 4: Main message loop
         while True:
             try:
                 # Receive message from client
-                data = await asyncio.wait_for(websocket.receive_json(), timeout=60)
+                # orjson decodes the text frame in C; receive_json would use stdlib json
+                # No receive timeout: if the manager drops this connection it
+                # closes the socket, which ends the wait with a disconnect
+                data = orjson.loads(await websocket.receive_text())
                 
                 # Update timestamp
                 manager.update_timestamp(connection_id)
                 
-                # Extract query and data
+                # Handle system messages before touching the rest of the payload
+                message_type = data.get("type")
                 query = data.get("query")
-                message_data = data.get("data") # Optional structured data (e.g. images)
-                force_agent = data.get("force_agent") # Optional forced agent from bootstrap command
-                logger.info(f"[WEBSOCKET] Received force_agent: {force_agent}")
-                
-                # Handle system messages
-                system_message_types = ["ping", "heartbeat", "heartbeat_ack", "connection", "pong"]
-                if (data.get("type") in system_message_types or 
-                    (query and isinstance(query, str) and query.lower() in system_message_types)):
-                    
-                    if data.get("type") == "ping" or (query and isinstance(query, str) and query.lower() == "ping"):
-                        await manager.send_to_session(session_id, {
-                            "type": "pong",
-                            "timestamp": time.time()
-                        })
+                query_lower = query.lower() if isinstance(query, str) else None
+                # Only strings can be looked up: a list or dict "type" is unhashable
+                if (isinstance(message_type, str) and message_type in SYSTEM_MESSAGE_TYPES) or query_lower in SYSTEM_MESSAGE_TYPES:
+                    if message_type == "ping" or query_lower == "ping":
+                        await manager.send_text_to_session(session_id, _PONG_TEMPLATE % cached_time())
                     else:
-                        await manager.send_to_session(session_id, {
-                            "type": "ack",
-                            "message": "System message received",
-                            "timestamp": time.time()
-                        })
+                        await manager.send_text_to_session(session_id, _SYSTEM_ACK_TEMPLATE % cached_time())
                     continue
                 
+                # Extract data
+                message_data = data.get("data") # Optional structured data (e.g. images)
+                force_agent = data.get("force_agent") # Optional forced agent from bootstrap command
+                logger.info("[WEBSOCKET] Received force_agent: %s", force_agent)
+                
                 # Validate query
                 if not query and not message_data:
-                    logger.warning(f"[WEBSOCKET] Empty query/data from session {session_id}")
+                    logger.warning("[WEBSOCKET] Empty query/data from session %s", session_id)
                     continue
                 
                 display_query = query[:50] if query and isinstance(query, str) else "[Binary/Structured Data]"
-                logger.info(f"[WEBSOCKET] Processing request for session {session_id}: {display_query}...")
+                logger.info("[WEBSOCKET] Processing request for session %s: %s...", session_id, display_query)
+                
+                # Step 5: Start the agent so it runs while the acknowledgment goes out.
+                # The ack is queued before the task first runs, so it still
+                # reaches the client ahead of anything the agent sends.
+                agent_task = asyncio.create_task(run_agent(
+                    user_id=user_id,
+                    query=query or "Process the provided data.",
+                    session_id=session_id,
+                    app_name="lexedge",
+                    message_data=message_data,
+                    force_agent=force_agent
+                ))
                 
                 # Send acknowledgment
                 await manager.send_to_session(session_id, {
                     "type": "ack",
                     "message": f"Processing request: {display_query}...",
-                    "timestamp": time.time()
+                    "timestamp": cached_time()
                 })
                 
-                # Step 5: Process through agent
                 try:
-                    result = await run_agent(
-                        user_id=user_id,
-                        query=query or "Process the provided data.",
-                        session_id=session_id,
-                        app_name="lexedge",
-                        message_data=message_data,
-                        force_agent=force_agent
-                    )
+                    result = await agent_task
                     
                     if result.get("response"):
                         # Step 6: Send response ONLY to this session (TENANT ISOLATED)
@@ -1446,7 +1604,7 @@ async def websocket_endpoint(
                             "user_name": result.get("user_name", ""),
                             "role": result.get("role", ""),
                             "action_suggestions": result.get("action_suggestions", {}),
-                            "timestamp": time.time()
+                            "timestamp": cached_time()
                         }
                         
                         # CRITICAL: Send only to this session, not broadcast
@@ -1456,25 +1614,18 @@ async def websocket_endpoint(
                             logger.error(f"[WEBSOCKET] Failed to send response to session {session_id}")
                             break
                         
-                        logger.info(f"[WEBSOCKET] ✅ Response sent to session {session_id}")
+                        logger.info("[WEBSOCKET] ✅ Response sent to session %s", session_id)
                     else:
-                        logger.info(f"[WEBSOCKET] Skipping empty response for session {session_id} (likely tool-handled)")
+                        logger.info("[WEBSOCKET] Skipping empty response for session %s (likely tool-handled)", session_id)
                     
                 except Exception as e:
                     logger.error(f"[WEBSOCKET] Error processing query: {str(e)}")
                     await manager.send_to_session(session_id, {
                         "type": "error",
                         "message": f"Error processing query: {str(e)}",
-                        "timestamp": time.time()
+                        "timestamp": cached_time()
                     })
                 
-            except asyncio.TimeoutError:
-                # Check if connection is still active
-                if connection_id not in manager.connection_timestamps:
-                    logger.warning(f"[WEBSOCKET] Connection {connection_id} timed out")
-                    break
-                continue
-                
             except Exception as e:
                 logger.error(f"[WEBSOCKET] Error in message loop: {str(e)}")
                 break
@@ -1513,12 +1664,52 @@ async def websocket_endpoint_admin(
 @app.get("/stream-demo", response_class=HTMLResponse)
 async def stream_demo():
     """Serve the streaming demo page"""
-    with open(os.path.join(STATIC_DIR, "stream_demo.html"), "r") as f:
-        content = f.read()
+    content = await _static_html("stream_demo.html")
+    if content is None:
+        raise HTTPException(status_code=404, detail="Streaming demo page not found")
     return content
 
 # ----- Voice WebSocket Endpoint -----
 
+# Events that carry audio go to the voice client as one binary frame:
+# [u32 little-endian header length][JSON event header][raw audio bytes].
+# The header is the event without the audio payload, so the PCM isn't
+# base64-encoded into the JSON.
+_VOICE_HEADER_LENGTH = struct.Struct("<I")
+
+# Microphone audio from the voice client: 16 kHz mono signed 16-bit PCM
+_PCM_INPUT_MIME_TYPE = "audio/pcm;rate=16000"
+# Browser audio arrives in ~20 ms chunks; they are coalesced before being
+# queued for the model, up to this many bytes (80 ms of input audio)...
+VOICE_AUDIO_FLUSH_BYTES = 2560
+# ...or for at most this many seconds after the first buffered chunk
+VOICE_AUDIO_FLUSH_INTERVAL = 0.06
+
+def _encode_voice_audio_frame(event) -> Optional[bytes]:
+    """Build the binary frame for an event with audio parts, or None if it has none."""
+    content = event.content
+    if content is None or not content.parts:
+        return None
+    audio_indexes = [
+        index for index, part in enumerate(content.parts)
+        if part.inline_data is not None
+        and part.inline_data.data
+        and (part.inline_data.mime_type or "").startswith("audio/")
+    ]
+    if not audio_indexes:
+        return None
+    header = orjson.dumps(event.model_dump(
+        mode="json",
+        exclude_none=True,
+        by_alias=True,
+        exclude={"content": {"parts": {index: {"inline_data": {"data"}} for index in audio_indexes}}}
+    ))
+    return b"".join((
+        _VOICE_HEADER_LENGTH.pack(len(header)),
+        header,
+        *(content.parts[index].inline_data.data for index in audio_indexes)
+    ))
+
 @app.websocket("/ws/voice")
 async def voice_websocket_endpoint(
     websocket: WebSocket,
@@ -1530,9 +1721,6 @@ async def voice_websocket_endpoint(
     WebSocket endpoint for bidirectional audio streaming (Voice Mode).
     Uses Google ADK Runner for low-latency streaming.
     """
-    from lexedge.main_agent import root_agent, create_runner
-    from lexedge.session import session_service
-    
     logger.info(f"[VOICE-WS] Connection request: user_id={user_id}, session_id={session_id}")
     await websocket.accept()
     logger.info("[VOICE-WS] Connection accepted")
@@ -1578,33 +1766,67 @@ async def voice_websocket_endpoint(
     async def upstream_task() -> None:
         """Receives messages from WebSocket and sends to LiveRequestQueue."""
         logger.debug("[VOICE-WS] upstream_task started")
-        while True:
-            try:
-                message = await websocket.receive()
-            except Exception as recv_err:
-                logger.error(f"[VOICE-WS] Error receiving WebSocket message: {recv_err}")
-                break
-
-            # Handle binary (audio)
-            if "bytes" in message:
-                audio_data = message["bytes"]
-                # logger.debug(f"[VOICE-WS] Received audio chunk: {len(audio_data)} bytes")
-                audio_blob = types.Blob(mime_type="audio/pcm;rate=16000", data=audio_data)
+        loop = asyncio.get_running_loop()
+        audio_buffer = bytearray()
+        flush_deadline = 0.0
+
+        def flush_audio() -> None:
+            if audio_buffer:
+                # Both fields are known-good, so skip pydantic validation on
+                # a path that runs many times a second
+                audio_blob = types.Blob.model_construct(mime_type=_PCM_INPUT_MIME_TYPE, data=bytes(audio_buffer))
                 live_request_queue.send_realtime(audio_blob)
+                audio_buffer.clear()
 
-            # Handle text (commands)
-            elif "text" in message:
-                text_data = message["text"]
-                logger.info(f"[VOICE-WS] Received text: {text_data}")
+        # The receive runs as its own task so a flush timeout never cancels it
+        # halfway through a frame; the same receive is awaited again after
+        receive = None
+        try:
+            while True:
+                if receive is None:
+                    receive = asyncio.ensure_future(websocket.receive())
+                if audio_buffer:
+                    # Wait no longer than the buffered audio may be held back
+                    done, _ = await asyncio.wait((receive,), timeout=max(flush_deadline - loop.time(), 0))
+                    if not done:
+                        flush_audio()
+                        continue
                 try:
-                    json_msg = json.loads(text_data)
-                    if json_msg.get("type") == "text":
-                         content = types.Content(parts=[types.Part(text=json_msg["text"])])
-                         live_request_queue.send_content(content)
-                except json.JSONDecodeError:
-                    # Treat as raw text
-                    content = types.Content(parts=[types.Part(text=text_data)])
-                    live_request_queue.send_content(content)
+                    message = await receive
+                except Exception as recv_err:
+                    logger.error(f"[VOICE-WS] Error receiving WebSocket message: {recv_err}")
+                    break
+                finally:
+                    receive = None
+
+                # Handle binary (audio)
+                if "bytes" in message:
+                    audio_data = message["bytes"]
+                    # logger.debug(f"[VOICE-WS] Received audio chunk: {len(audio_data)} bytes")
+                    if not audio_buffer:
+                        flush_deadline = loop.time() + VOICE_AUDIO_FLUSH_INTERVAL
+                    audio_buffer += audio_data
+                    if len(audio_buffer) >= VOICE_AUDIO_FLUSH_BYTES:
+                        flush_audio()
+
+                # Handle text (commands)
+                elif "text" in message:
+                    # Audio received before the command goes to the model first
+                    flush_audio()
+                    text_data = message["text"]
+                    logger.info(f"[VOICE-WS] Received text: {text_data}")
+                    try:
+                        json_msg = orjson.loads(text_data)
+                        if json_msg.get("type") == "text":
+                             content = types.Content(parts=[types.Part(text=json_msg["text"])])
+                             live_request_queue.send_content(content)
+                    except orjson.JSONDecodeError:
+                        # Treat as raw text
+                        content = types.Content(parts=[types.Part(text=text_data)])
+                        live_request_queue.send_content(content)
+        finally:
+            if receive is not None:
+                receive.cancel()
 
     async def downstream_task() -> None:
         """Receives Events from runner and sends to WebSocket."""
@@ -1616,26 +1838,43 @@ async def voice_websocket_endpoint(
                 live_request_queue=live_request_queue,
                 run_config=run_config,
             ):
-                event_json = event.model_dump_json(exclude_none=True, by_alias=True)
-                await websocket.send_text(event_json)
+                audio_frame = _encode_voice_audio_frame(event)
+                if audio_frame is not None:
+                    await websocket.send_bytes(audio_frame)
+                else:
+                    event_json = event.model_dump_json(exclude_none=True, by_alias=True)
+                    await websocket.send_text(event_json)
         except Exception as e:
-            logger.error(f"[VOICE-WS] Error in downstream task: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception("[VOICE-WS] Error in downstream task: %s", e)
 
+    upstream = asyncio.create_task(upstream_task())
+    downstream = asyncio.create_task(downstream_task())
     try:
-        await asyncio.gather(upstream_task(), downstream_task())
+        # Either side finishing ends the session: once the client is gone the
+        # live run has no one to stream to, and once the run ends there is
+        # nothing left to feed it
+        done, _ = await asyncio.wait((upstream, downstream), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except WebSocketDisconnect:
         logger.info("[VOICE-WS] Client disconnected")
     except Exception as e:
         logger.error(f"[VOICE-WS] Unexpected error: {e}")
     finally:
         live_request_queue.close()
+        for task in (upstream, downstream):
+            task.cancel()
+        await asyncio.wait((upstream, downstream))
         logger.info("[VOICE-WS] Closed")
 
 
 # ----- Main Function -----
 
+# WebSocket transport limits for the uvicorn server
+WS_MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # bytes
+WS_PING_INTERVAL = 20.0  # seconds
+WS_PING_TIMEOUT = 20.0  # seconds
+
 def start():
     """Run the FastAPI app with uvicorn with comprehensive server startup cleanup"""
     import uvicorn
@@ -1655,8 +1894,26 @@ def start():
     logger.info("=" * 60)
     
     # Run the FastAPI app
-    # NOTE: reload=False to prevent session loss on file changes
-    uvicorn.run("lexedge.api.app:app", host="0.0.0.0", port=3334, reload=False)
+    # NOTE: reload=False to prevent session loss on file changes. It stays a
+    # single worker too: WebSocket connections and sessions live in-process.
+    # loop/http "auto" select uvloop and httptools when installed and fall
+    # back to the pure-Python asyncio loop and h11 otherwise
+    uvicorn.run(
+        "lexedge.api.app:app",
+        host="0.0.0.0",
+        port=3334,
+        reload=False,
+        loop="auto",
+        http="auto",
+        ws="websockets",
+        # Messages are small JSON or raw PCM; compressing them costs more CPU
+        # than it saves in bandwidth
+        ws_per_message_deflate=False,
+        # Uploaded documents and images travel inline in /ws messages
+        ws_max_size=WS_MAX_MESSAGE_SIZE,
+        ws_ping_interval=WS_PING_INTERVAL,
+        ws_ping_timeout=WS_PING_TIMEOUT,
+    )
 
 if __name__ == "__main__":
     start() 
@@ -0,0 +1,114 @@
+"""
+StaticFiles variant that serves small assets from memory.
+
+The web UI requests the same handful of small scripts, stylesheets and icons
+on every page load. Files under SMALL_FILE_LIMIT are read once and then
+answered straight from an LRU cache. Each request still stats the file, so
+edits on disk are picked up.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+logger = logging.getLogger(__name__)
+
+# Files up to this size (bytes) are kept in memory after their first request
+SMALL_FILE_LIMIT = 64 * 1024
+# Maximum number of cached files
+STATIC_CACHE_SIZE = 128
+
+
+def _stat_key(stat_result: os.stat_result) -> Tuple[float, int]:
+    """Identify a file version by modification time and size."""
+    return stat_result.st_mtime, stat_result.st_size
+
+
+def _stat_headers(full_path: str, stat_result: os.stat_result) -> Dict[str, str]:
+    """Build the headers FileResponse would send for this file."""
+    # Same ETag derivation as FileResponse, so clients revalidate against
+    # either response interchangeably
+    etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+    content_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+    if content_type.startswith("text/"):
+        content_type += "; charset=utf-8"
+    return {
+        "content-type": content_type,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "etag": f'"{hashlib.md5(etag_base.encode()).hexdigest()}"',
+    }
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that answers small files from an in-memory LRU cache"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # {full_path: ((mtime, size), body, headers)}
+        self._cache: "OrderedDict[str, Tuple[Tuple[float, int], bytes, Dict[str, str]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _cached(self, full_path: str, stat_result: os.stat_result) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """Return the cached body and headers if they match the file on disk."""
+        with self._cache_lock:
+            entry = self._cache.get(full_path)
+            if entry is None or entry[0] != _stat_key(stat_result):
+                return None
+            self._cache.move_to_end(full_path)
+            return entry[1], entry[2]
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        # Runs in a worker thread, so a cache miss on a small file is read
+        # here instead of on the event loop
+        full_path, stat_result = super().lookup_path(path)
+        if (
+            stat_result is not None
+            and stat.S_ISREG(stat_result.st_mode)
+            and stat_result.st_size <= SMALL_FILE_LIMIT
+            and self._cached(full_path, stat_result) is None
+        ):
+            try:
+                with open(full_path, "rb") as f:
+                    body = f.read()
+            except OSError as e:
+                logger.warning(f"Could not cache static file {full_path}: {e}")
+            else:
+                # Only keep the read if the file didn't change underneath it
+                if len(body) == stat_result.st_size:
+                    entry = (_stat_key(stat_result), body, _stat_headers(full_path, stat_result))
+                    with self._cache_lock:
+                        self._cache[full_path] = entry
+                        self._cache.move_to_end(full_path)
+                        while len(self._cache) > STATIC_CACHE_SIZE:
+                            self._cache.popitem(last=False)
+        return full_path, stat_result
+
+    def file_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        # Range requests need FileResponse's partial-content handling
+        cached = None if "range" in request_headers else self._cached(full_path, stat_result)
+        if cached is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        body, headers = cached
+        response = Response(body, status_code=status_code, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -7,14 +7,19 @@ the existing one in app.py (around line 1345).
 CRITICAL FIX: Ensures each tenant has isolated WebSocket connections.
 """
 
-import asyncio
 import time
 import logging
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect, Query
 from typing import Optional
 
+from lexedge.utils.websocket_manager import cached_time
+
 logger = logging.getLogger(__name__)
 
+# Client keepalive/control messages, matched on "type" or on the query text
+_SYSTEM_MESSAGE_TYPES = frozenset({"ping", "heartbeat", "heartbeat_ack", "connection", "pong"})
+
 # This should be added to app.py to replace the existing @app.websocket("/ws/{client_id}")
 async def websocket_endpoint_fixed(
     websocket: WebSocket,
@@ -43,16 +48,11 @@ async def websocket_endpoint_fixed(
         logger.info(f"[WEBSOCKET] Connection attempt for session: {session_id}, tenant: {tenant_id}")
         
         try:
-            # Get session from database
-            # Note: We need to get the session to validate it exists
-            # For now, we'll list all sessions and find the matching one
-            all_sessions = session_service.list_sessions(app_name="lexedge")
-            session = None
-            
-            for s in all_sessions:
-                if s.id == session_id:
-                    session = s
-                    break
+            # Get session from database by its primary key to validate it exists
+            session = await session_service.get_session_by_id(
+                app_name="lexedge",
+                session_id=session_id
+            )
             
             if not session:
                 logger.error(f"[WEBSOCKET] Session {session_id} not found")
@@ -108,44 +108,52 @@ async def websocket_endpoint_fixed(
         while True:
             try:
                 # Receive message from client
-                data = await asyncio.wait_for(websocket.receive_json(), timeout=60)
+                # No receive timeout: if the manager drops this connection it
+                # closes the socket, which ends the wait with a disconnect
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+                # orjson parses text and binary frames alike, so a binary JSON
+                # frame is never decoded to str first
+                data = orjson.loads(message.get("bytes") or message.get("text"))
                 
                 # Update timestamp
                 manager.update_timestamp(connection_id)
+                now = cached_time()
                 
                 # Extract query
+                message_type = data.get("type")
                 query = data.get("query")
+                query_lower = query.lower() if isinstance(query, str) else None
                 
                 # Handle system messages
-                system_message_types = ["ping", "heartbeat", "heartbeat_ack", "connection", "pong"]
-                if (data.get("type") in system_message_types or 
-                    (query and query.lower() in system_message_types)):
-                    
-                    if data.get("type") == "ping" or (query and query.lower() == "ping"):
+                # Only strings can be looked up: a list or dict "type" is unhashable
+                if (isinstance(message_type, str) and message_type in _SYSTEM_MESSAGE_TYPES) or query_lower in _SYSTEM_MESSAGE_TYPES:
+                    if message_type == "ping" or query_lower == "ping":
                         await manager.send_to_session(session_id, {
                             "type": "pong",
-                            "timestamp": time.time()
+                            "timestamp": now
                         })
                     else:
                         await manager.send_to_session(session_id, {
                             "type": "ack",
                             "message": "System message received",
-                            "timestamp": time.time()
+                            "timestamp": now
                         })
                     continue
                 
                 # Validate query
                 if not query:
-                    logger.warning(f"[WEBSOCKET] Empty query from session {session_id}")
+                    logger.warning("[WEBSOCKET] Empty query from session %s", session_id)
                     continue
                 
-                logger.info(f"[WEBSOCKET] Processing query for session {session_id}: {query[:50]}...")
+                logger.info("[WEBSOCKET] Processing query for session %s: %.50s...", session_id, query)
                 
                 # Send acknowledgment
                 await manager.send_to_session(session_id, {
                     "type": "ack",
                     "message": f"Processing query: {query[:50]}...",
-                    "timestamp": time.time()
+                    "timestamp": now
                 })
                 
                 # Step 5: Process through agent
@@ -169,7 +177,7 @@ async def websocket_endpoint_fixed(
                         "user_name": result.get("user_name", ""),
                         "role": result.get("role", ""),
                         "action_suggestions": result.get("action_suggestions", {}),
-                        "timestamp": time.time()
+                        "timestamp": cached_time()
                     }
                     
                     # CRITICAL: Send only to this session, not broadcast
@@ -179,23 +187,16 @@ async def websocket_endpoint_fixed(
                         logger.error(f"[WEBSOCKET] Failed to send response to session {session_id}")
                         break
                     
-                    logger.info(f"[WEBSOCKET] ✅ Response sent to session {session_id}")
+                    logger.info("[WEBSOCKET] ✅ Response sent to session %s", session_id)
                     
                 except Exception as e:
                     logger.error(f"[WEBSOCKET] Error processing query: {str(e)}")
                     await manager.send_to_session(session_id, {
                         "type": "error",
                         "message": f"Error processing query: {str(e)}",
-                        "timestamp": time.time()
+                        "timestamp": cached_time()
                     })
                 
-            except asyncio.TimeoutError:
-                # Check if connection is still active
-                if connection_id not in manager.connection_timestamps:
-                    logger.warning(f"[WEBSOCKET] Connection {connection_id} timed out")
-                    break
-                continue
-                
             except Exception as e:
                 logger.error(f"[WEBSOCKET] Error in message loop: {str(e)}")
                 break
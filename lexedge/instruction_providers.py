@@ -76,7 +76,7 @@ def root_agent_instruction_provider(context: ReadonlyContext) -> str:
     Current Case Background:
     {get_case_context_string()}
 
-    ### � RECENT FINDINGS (GROUNDING):
+    ### 🔍 RECENT FINDINGS (GROUNDING):
     {get_recent_legal_findings_context()}
     
     ### INDIA-SPECIFIC NOTES:
@@ -0,0 +1,149 @@
+"""
+Optional Redis cache for session lookups by ID.
+
+The SQLite database stays authoritative. The cache only short-circuits
+SQLiteSessionService.get_session_by_id, which the WebSocket handshake and
+/validate-session call. Every write path in the service invalidates the
+affected entries, and entries also expire after SESSION_CACHE_TTL seconds.
+
+Invalidation also bumps a per-session generation counter, and clear() bumps
+a global epoch that is part of every generation. A lookup reads the
+generation before it queries the database and fills the cache only if the
+generation is unchanged, so a fill that raced with a write (say, a logout
+deleting the session) can't put the pre-write row back for a full TTL.
+
+Enable it with USE_REDIS_SESSION_CACHE=true (plus REDIS_URL) and the redis
+package installed. Without those, no cache is created.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Try to import Redis; the cache is simply disabled without it
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "300"))
+_KEY_PREFIX = "session_cache:"
+_GENERATION_PREFIX = "session_cache_gen:"
+# Bumped by clear(); outside _KEY_PREFIX so clearing doesn't delete it
+_EPOCH_KEY = "session_cache_epoch"
+
+# KEYS: entry, generation, epoch. ARGV: expected "epoch:generation", entry
+# JSON, TTL. Missing counters count as "0".
+_SET_IF_CURRENT_LUA = """
+local current = (redis.call('GET', KEYS[3]) or '0') .. ':' .. (redis.call('GET', KEYS[2]) or '0')
+if current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class SessionCache:
+    """
+    Redis cache of session rows keyed by session ID.
+
+    Entries are {"app_name", "user_id", "state"} JSON blobs. Redis errors are
+    logged and treated as misses, so an unreachable cache only costs the
+    database lookup it was meant to save.
+    """
+
+    def __init__(self, redis_url: str, ttl_seconds: int = SESSION_CACHE_TTL):
+        self.ttl_seconds = ttl_seconds
+        # The client connects lazily on first command
+        self._client = aioredis.from_url(
+            redis_url,
+            decode_responses=True,
+            socket_connect_timeout=1,
+            socket_keepalive=True
+        )
+        self._set_if_current = self._client.register_script(_SET_IF_CURRENT_LUA)
+
+    @classmethod
+    def from_env(cls) -> Optional["SessionCache"]:
+        """Create the cache if enabled in the environment, else return None."""
+        if os.getenv("USE_REDIS_SESSION_CACHE", "false").lower() != "true":
+            return None
+        if not REDIS_AVAILABLE:
+            logger.warning("USE_REDIS_SESSION_CACHE is set but redis is not installed. Install with: pip install redis")
+            return None
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        logger.info(f"Session lookup cache enabled (ttl={SESSION_CACHE_TTL}s)")
+        return cls(redis_url)
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for a session, or None on a miss."""
+        try:
+            raw = await self._client.get(_KEY_PREFIX + session_id)
+        except Exception as e:
+            logger.warning(f"Session cache read failed: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    async def generation(self, session_id: str) -> Optional[str]:
+        """
+        Return the session's current generation, to pass to set() later.
+
+        Returns None if Redis can't be reached, in which case the caller
+        should skip filling the cache.
+        """
+        try:
+            epoch, generation = await self._client.mget(_EPOCH_KEY, _GENERATION_PREFIX + session_id)
+        except Exception as e:
+            logger.warning(f"Session cache read failed: {e}")
+            return None
+        return f"{epoch or 0}:{generation or 0}"
+
+    async def set(self, session_id: str, entry: Dict[str, Any], generation: str) -> None:
+        """
+        Cache a session entry for ttl_seconds.
+
+        The entry is dropped if the session was invalidated (or the cache
+        cleared) since ``generation`` was read, since it may then predate
+        the write.
+        """
+        try:
+            await self._set_if_current(
+                keys=[_KEY_PREFIX + session_id, _GENERATION_PREFIX + session_id, _EPOCH_KEY],
+                args=[generation, json.dumps(entry), self.ttl_seconds],
+            )
+        except Exception as e:
+            logger.warning(f"Session cache write failed: {e}")
+
+    async def invalidate(self, *session_ids: str) -> None:
+        """Drop the cached entries for the given sessions and bump their generations."""
+        if not session_ids:
+            return
+        try:
+            async with self._client.pipeline(transaction=True) as pipe:
+                for session_id in session_ids:
+                    # Generations only need to outlive lookups still in flight
+                    pipe.incr(_GENERATION_PREFIX + session_id)
+                    pipe.expire(_GENERATION_PREFIX + session_id, self.ttl_seconds)
+                pipe.delete(*(_KEY_PREFIX + session_id for session_id in session_ids))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Session cache invalidation failed: {e}")
+
+    async def clear(self) -> None:
+        """Drop every cached session entry and bump the epoch.
+
+        The epoch goes first: fills by lookups that started before the clear
+        are then rejected, and any that landed earlier are deleted below.
+        """
+        try:
+            await self._client.incr(_EPOCH_KEY)
+            keys = [key async for key in self._client.scan_iter(match=_KEY_PREFIX + "*", count=500)]
+            if keys:
+                await self._client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Session cache clear failed: {e}")
@@ -95,18 +95,23 @@ class SessionFirewall:
             if (current_time - last_activity) > (self.session_timeout_minutes * 60):
                 expired_sessions.append(session_id)
         
+        if not expired_sessions:
+            return
+        
+        # Load the stored sessions once for the whole batch and index them by ID,
+        # rather than rescanning every session for each expired one
+        sessions_by_id = {session.id: session for session in await session_service.list_sessions()}
+        
         for session_id in expired_sessions:
             try:
-                all_sessions = await session_service.list_sessions()
-                for session in all_sessions:
-                    if session.id == session_id:
-                        logger.info(f"Deleting expired session {session_id} for user {session.user_id}")
-                        await session_service.delete_session(
-                            app_name=session.app_name,
-                            user_id=session.user_id,
-                            session_id=session_id
-                        )
-                        break
+                session = sessions_by_id.get(session_id)
+                if session is not None:
+                    logger.info(f"Deleting expired session {session_id} for user {session.user_id}")
+                    await session_service.delete_session(
+                        app_name=session.app_name,
+                        user_id=session.user_id,
+                        session_id=session_id
+                    )
                 
                 self.unregister_session(session_id)
                 
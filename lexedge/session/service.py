@@ -2,12 +2,13 @@
 Session management service for the Appliview application.
 Provides persistence with SQLite database.
 """
+import asyncio
 import base64
 import json
 import logging
 import sqlite3
 import uuid
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 import time
 
 from google.adk.sessions import InMemorySessionService, Session
@@ -17,13 +18,27 @@ from google.genai import types
 
 try:
     # Package import
+    from .cache import SessionCache
     from ..config import DB_PATH, MAX_SESSIONS_PER_USER, MAX_MESSAGES_PER_SESSION
 except ImportError:
     # Direct import when running from applivew directory
+    from cache import SessionCache
     from config import DB_PATH, MAX_SESSIONS_PER_USER, MAX_MESSAGES_PER_SESSION
 
 logger = logging.getLogger(__name__)
 
+def _apply_merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply an RFC 7396 merge-patch to target in place, as SQLite's json_patch does."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            current = target.get(key)
+            target[key] = _apply_merge_patch(current if isinstance(current, dict) else {}, value)
+        else:
+            target[key] = value
+    return target
+
 class SQLiteSessionService(InMemorySessionService):
     """SQLite-based implementation of SessionService."""
     
@@ -37,6 +52,13 @@ class SQLiteSessionService(InMemorySessionService):
         self.max_messages_per_session = max_messages_per_session
         self._init_db()
         self._runners = {}  # Cache for runners
+        # Optional Redis cache for lookups by session ID (None when disabled)
+        self.cache = SessionCache.from_env()
+    
+    async def _invalidate_cached(self, *session_ids: str) -> None:
+        """Drop sessions from the lookup cache after their rows change."""
+        if self.cache is not None and session_ids:
+            await self.cache.invalidate(*session_ids)
     
     def _init_db(self):
         """Initialize database tables."""
@@ -87,6 +109,15 @@ class SQLiteSessionService(InMemorySessionService):
                     FOREIGN KEY (session_id) REFERENCES sessions(id)
                 )
             """)
+            
+            # Per-user session listings filter on (app_name, user_id) and order
+            # by updated_at; the index covers both so SQLite skips the sort.
+            # It replaces the earlier (app_name, user_id)-only index.
+            conn.execute("DROP INDEX IF EXISTS idx_sessions_app_user")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_sessions_app_user_updated "
+                "ON sessions (app_name, user_id, updated_at)"
+            )
             conn.commit()
     
     def _count_user_sessions(self, user_id: str) -> int:
@@ -125,14 +156,16 @@ class SQLiteSessionService(InMemorySessionService):
             )
             
             # Delete old sessions and their messages
-            for row in cursor.fetchall():
-                session_id = row[0]
+            removed_ids = [row[0] for row in cursor.fetchall()]
+            for session_id in removed_ids:
                 # Delete messages first due to foreign key constraint
                 conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
                 # Delete session
                 conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
             
             conn.commit()
+        
+        await self._invalidate_cached(*removed_ids)
     
     async def _enforce_message_limit(self, session_id: str) -> None:
         """Enforce message limit per session by removing oldest messages if limit exceeded."""
@@ -184,6 +217,9 @@ class SQLiteSessionService(InMemorySessionService):
                 )
             conn.commit()
         
+        if row:
+            await self._invalidate_cached(session_id)
+        
         # Call parent method to maintain in-memory state as well
         try:
             # Try to get the session from the parent's in-memory storage
@@ -201,6 +237,72 @@ class SQLiteSessionService(InMemorySessionService):
         
         return result
     
+    async def update_session_state(self, *, app_name: str, user_id: str,
+                                   session_id: str, state: Dict[str, Any]) -> bool:
+        """
+        Persist new state for an existing session in a single UPDATE.
+
+        Unlike create_session this skips the existence check and the
+        per-user session limit, since the session is known to exist.
+
+        Returns:
+            True if the session row was updated, False if it doesn't exist
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET state = ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND app_name = ? AND user_id = ?",
+                (json.dumps(state), session_id, app_name, user_id)
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                return False
+        
+        await self._invalidate_cached(session_id)
+        
+        # Keep the in-memory copy in sync, as create_session does
+        try:
+            result = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            result.state = state
+        except Exception:
+            pass
+        
+        return True
+    
+    async def merge_session_state(self, *, app_name: str, user_id: str,
+                                  session_id: str, state_patch: Dict[str, Any]) -> bool:
+        """
+        Merge top-level keys into an existing session's state in one UPDATE.
+
+        SQLite applies the patch with json_patch, so the stored state is never
+        read back into Python. Patch values replace the stored ones the way
+        dict.update would, except that a None value removes the key and a
+        dict value is merged into the stored one (RFC 7396 merge-patch).
+
+        Returns:
+            True if the session row was updated, False if it doesn't exist
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET state = json_patch(state, ?), updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND app_name = ? AND user_id = ?",
+                (json.dumps(state_patch), session_id, app_name, user_id)
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                return False
+        
+        await self._invalidate_cached(session_id)
+        
+        # Keep the in-memory copy in sync, as update_session_state does
+        try:
+            result = await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            _apply_merge_patch(result.state, state_patch)
+        except Exception:
+            pass
+        
+        return True
+    
     async def get_session(self, *, app_name: str, user_id: str, session_id: str) -> Session:
         """Get session information."""
         with sqlite3.connect(self.db_path) as conn:
@@ -227,8 +329,71 @@ class SQLiteSessionService(InMemorySessionService):
                 session_id=session_id
             )
     
+    async def get_session_by_id(self, *, app_name: str, session_id: str) -> Optional[Session]:
+        """Get a session by its ID alone, without knowing the owning user.
+
+        Returns None if no session with a valid state exists.
+        """
+        if self.cache is not None:
+            entry = await self.cache.get(session_id)
+            if entry is not None and entry.get("app_name") == app_name:
+                return Session(
+                    id=session_id,
+                    app_name=app_name,
+                    user_id=entry["user_id"],
+                    state=entry["state"],
+                    last_update_time=time.time()
+                )
+        
+        # Read the generation before the row: if a write lands in between,
+        # the generation moves on and the fill below is skipped
+        generation = await self.cache.generation(session_id) if self.cache is not None else None
+        
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT user_id, state FROM sessions WHERE id = ? AND app_name = ?",
+                (session_id, app_name)
+            ).fetchone()
+        
+        if not row:
+            return None
+        
+        user_id, state_str = row
+        try:
+            state = json.loads(state_str) if state_str else None
+        except ValueError:
+            logger.warning(f"Invalid state JSON for session {session_id}")
+            return None
+        if not isinstance(state, dict):
+            return None
+        
+        if generation is not None:
+            await self.cache.set(session_id, {"app_name": app_name, "user_id": user_id, "state": state}, generation)
+        
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=state,
+            last_update_time=time.time()  # Use current time since we don't have the actual update time
+        )
+    
     async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
         """Delete a session."""
+        # Run the deletes in a worker thread so callers can overlap them with
+        # other teardown work instead of blocking the event loop
+        await asyncio.to_thread(self._delete_session_rows, app_name, user_id, session_id)
+        await self._invalidate_cached(session_id)
+        
+        # Delete from memory too
+        try:
+            super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        except Exception:
+            # Ignore if it doesn't exist in memory
+            pass
+    
+    def _delete_session_rows(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Delete a session's message and session rows in one transaction."""
         with sqlite3.connect(self.db_path) as conn:
             # Delete messages first due to foreign key constraint
             conn.execute(
@@ -241,13 +406,6 @@ class SQLiteSessionService(InMemorySessionService):
                 (session_id, app_name, user_id)
             )
             conn.commit()
-        
-        # Delete from memory too
-        try:
-            super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
-        except Exception:
-            # Ignore if it doesn't exist in memory
-            pass
     
     async def get_runner(self, *, app_name: str) -> Optional[Runner]:
         """Get existing runner for an application."""
@@ -496,6 +654,72 @@ class SQLiteSessionService(InMemorySessionService):
         logger.info(f"Returning {len(sessions)} valid sessions")
         return sessions
 
+    async def list_sessions_by_user(self, *, app_name: str, user_id: str,
+                                    state_keys: Optional[Sequence[str]] = None) -> List[Session]:
+        """List one user's sessions for an app via the (app_name, user_id) index.
+
+        With state_keys, only those top-level state entries are read: SQLite
+        extracts them from the stored JSON, so the rest of each state blob is
+        never decoded in Python. Absent keys are left out of the state.
+        """
+        if not state_keys:
+            return await self.list_sessions(app_name=app_name, user_id=user_id)
+        
+        # json_patch onto {} drops the null members json_object emits for absent keys
+        projection = "json_patch('{}', json_object(%s))" % ", ".join("?, state -> ?" for _ in state_keys)
+        params: List[Any] = []
+        for key in state_keys:
+            params.extend((key, f"$.{key}"))
+        params.extend((app_name, user_id))
+        query = (
+            f"SELECT id, {projection} FROM sessions "
+            "WHERE app_name = ? AND user_id = ? ORDER BY updated_at DESC"
+        )
+        
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(query, params).fetchall()
+        except sqlite3.OperationalError as e:
+            # SQLite without the -> operator, or a row with malformed state:
+            # load full states in the same order and project them here
+            logger.warning(f"State projection unavailable, loading full sessions: {e}")
+            rows = self._project_session_states(app_name, user_id, state_keys)
+        else:
+            rows = [(session_id, json.loads(state_str)) for session_id, state_str in rows]
+        
+        return [
+            Session(
+                id=session_id,
+                app_name=app_name,
+                user_id=user_id,
+                state=state,
+                last_update_time=time.time()  # Use current time since we don't have the actual update time
+            )
+            for session_id, state in rows
+        ]
+
+    def _project_session_states(self, app_name: str, user_id: str,
+                                state_keys: Sequence[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Project state keys in Python, newest session first, skipping rows with bad state."""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT id, state FROM sessions "
+                "WHERE app_name = ? AND user_id = ? ORDER BY updated_at DESC",
+                (app_name, user_id)
+            ).fetchall()
+        
+        projected = []
+        for session_id, state_str in rows:
+            try:
+                state = json.loads(state_str) if state_str else None
+            except ValueError:
+                state = None
+            if not isinstance(state, dict):
+                logger.warning(f"Invalid state for session {session_id}, user {user_id}. Skipping.")
+                continue
+            projected.append((session_id, {key: state[key] for key in state_keys if key in state}))
+        return projected
+
     async def _cleanup_stale_sessions(self, max_age_hours=24):
         """Clean up sessions older than the specified age in hours"""
         with sqlite3.connect(self.db_path) as conn:
@@ -522,11 +746,21 @@ class SQLiteSessionService(InMemorySessionService):
                     logger.error(f"Error cleaning up session {session_id}: {str(e)}")
             
             conn.commit()
-            
-            return len(stale_session_ids)
+        
+        await self._invalidate_cached(*stale_session_ids)
+        return len(stale_session_ids)
 
     async def clear_all_sessions(self):
         """Clear all sessions from the database, use with caution!"""
+        # Bulk deletes can take a while on a large database; keep them off
+        # the event loop so other cleanup and requests proceed meanwhile
+        session_count = await asyncio.to_thread(self._clear_all_sessions)
+        if self.cache is not None:
+            await self.cache.clear()
+        return session_count
+
+    def _clear_all_sessions(self) -> int:
+        """Delete every session and message row, returning the session count."""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 # Get count of sessions before deletion for reporting
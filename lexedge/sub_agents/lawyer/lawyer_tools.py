@@ -268,7 +268,7 @@ def _get_legal_suggestions(query: str) -> dict:
             "caption": "Review contract terms",
             "command": "analyze the key terms and risks in this contract",
             "icon": "file-text",
-            "icon_display": "� Contract Review",
+            "icon_display": "📄 Contract Review",
             "priority": 1,
             "category": "legal"
         })
@@ -291,7 +291,7 @@ def _get_legal_suggestions(query: str) -> dict:
             "caption": "Research applicable laws",
             "command": "research applicable laws and precedents",
             "icon": "search",
-            "icon_display": "� Research",
+            "icon_display": "🔍 Research",
             "priority": 2,
             "category": "legal"
         },
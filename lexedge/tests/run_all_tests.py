@@ -61,7 +61,9 @@ def main():
     
     # Define tests in logical order (relative to current directory)
     test_files = [
+        "test_session_service.py",              # Foundation: session service lookups
         "test_session_management.py",           # Foundation: session management
+        "test_token_validation_cache.py",       # Foundation: token-login validation cache
         "test_agent_pusher_basic.py",          # Core: basic agent pusher
         "test_websocket_integration.py",        # Integration: WebSocket functionality
         "test_job_cancellation.py",            # Specific: job tool cancellation
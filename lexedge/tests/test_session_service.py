@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Tests for SQLiteSessionService lookups against a throwaway SQLite database.
+Covers the session lookup cache, which is exercised with an in-memory
+stand-in that follows SessionCache's generation rules, the state
+projection in list_sessions_by_user, and merge-patch state updates.
+"""
+
+import sys
+import os
+import asyncio
+import json
+import sqlite3
+import tempfile
+
+# Add workspace root to path for testing (go up 3 levels from test file)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lexedge.session.service import SQLiteSessionService, _apply_merge_patch
+
+APP_NAME = "lexedge"
+USER_ID = "test_user"
+
+
+class FakeSessionCache:
+    """In-memory SessionCache: set() is dropped once the generation has moved on."""
+
+    def __init__(self):
+        self.entries = {}
+        self.generations = {}
+        self.epoch = 0
+
+    async def get(self, session_id):
+        return self.entries.get(session_id)
+
+    async def generation(self, session_id):
+        return f"{self.epoch}:{self.generations.get(session_id, 0)}"
+
+    async def set(self, session_id, entry, generation):
+        if await self.generation(session_id) == generation:
+            self.entries[session_id] = entry
+
+    async def invalidate(self, *session_ids):
+        for session_id in session_ids:
+            self.generations[session_id] = self.generations.get(session_id, 0) + 1
+            self.entries.pop(session_id, None)
+
+    async def clear(self):
+        self.epoch += 1
+        self.entries.clear()
+
+
+def make_service(db_dir):
+    """Create a service backed by a fresh database file with the fake cache."""
+    service = SQLiteSessionService(db_path=os.path.join(db_dir, "sessions.db"))
+    service.cache = FakeSessionCache()
+    return service
+
+
+async def _create_logged_in_session(service):
+    session = await service.create_session(
+        app_name=APP_NAME,
+        user_id=USER_ID,
+        state={"is_authenticated": True}
+    )
+    return session.id
+
+
+def test_logout_then_validate():
+    """A cached session stops validating once it is deleted."""
+    async def scenario(service):
+        session_id = await _create_logged_in_session(service)
+
+        # The first lookup fills the cache, the second is served from it
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is not None
+        assert session_id in service.cache.entries
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is not None
+
+        await service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is None
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(scenario(make_service(db_dir)))
+
+
+def test_logout_during_validate_fill():
+    """A logout landing between a lookup's read and its cache fill wins."""
+    async def scenario(service):
+        session_id = await _create_logged_in_session(service)
+        cache = service.cache
+        fill = cache.set
+
+        async def logout_then_fill(sid, entry, generation):
+            # The lookup has already read the row; log out before it caches it
+            await service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=sid)
+            await fill(sid, entry, generation)
+
+        cache.set = logout_then_fill
+        # This lookup read the row before the logout, so it still sees it
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is not None
+        cache.set = fill
+
+        assert session_id not in cache.entries
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is None
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(scenario(make_service(db_dir)))
+
+
+def test_clear_during_validate_fill():
+    """Clearing all sessions between a lookup's read and its cache fill wins."""
+    async def scenario(service):
+        session_id = await _create_logged_in_session(service)
+        cache = service.cache
+        fill = cache.set
+
+        async def clear_then_fill(sid, entry, generation):
+            await service.clear_all_sessions()
+            await fill(sid, entry, generation)
+
+        cache.set = clear_then_fill
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is not None
+        cache.set = fill
+
+        assert session_id not in cache.entries
+        assert await service.get_session_by_id(app_name=APP_NAME, session_id=session_id) is None
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(scenario(make_service(db_dir)))
+
+
+async def _create_sessions_in_order(service, states):
+    """Create sessions whose updated_at increases in list order; returns their ids."""
+    session_ids = []
+    for state in states:
+        session = await service.create_session(app_name=APP_NAME, user_id=USER_ID, state=state)
+        session_ids.append(session.id)
+    # CURRENT_TIMESTAMP has one-second resolution, so spread the rows out
+    with sqlite3.connect(service.db_path) as conn:
+        conn.executemany(
+            "UPDATE sessions SET updated_at = ? WHERE id = ?",
+            [(f"2024-01-01 00:{minute:02d}:00", session_id) for minute, session_id in enumerate(session_ids)]
+        )
+        conn.commit()
+    return session_ids
+
+
+def test_list_sessions_by_user_projection():
+    """Only requested keys come back, absent keys are left out, newest first."""
+    async def scenario(service):
+        session_ids = await _create_sessions_in_order(service, [
+            {"interaction_history": ["a"], "last_query": "first", "token": "x"},
+            {"last_query": "second"},
+            {"interaction_history": [], "last_query": None},
+        ])
+        # Another user's session must not show up
+        await service.create_session(app_name=APP_NAME, user_id="other_user", state={"last_query": "other"})
+
+        sessions = await service.list_sessions_by_user(
+            app_name=APP_NAME,
+            user_id=USER_ID,
+            state_keys=("interaction_history", "last_query")
+        )
+
+        assert [session.id for session in sessions] == session_ids[::-1]
+        assert [session.state for session in sessions] == [
+            # A stored null reads back like an absent key
+            {"interaction_history": []},
+            {"last_query": "second"},
+            {"interaction_history": ["a"], "last_query": "first"},
+        ]
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(scenario(make_service(db_dir)))
+
+
+def test_list_sessions_by_user_fallback():
+    """Malformed state makes SQLite reject the projection; the fallback keeps the order."""
+    async def scenario(service):
+        session_ids = await _create_sessions_in_order(service, [
+            {"last_query": "first", "token": "x"},
+            {"last_query": "second"},
+            {"last_query": "broken"},
+            {"token": "y"},
+        ])
+        with sqlite3.connect(service.db_path) as conn:
+            conn.execute("UPDATE sessions SET state = '{not json' WHERE id = ?", (session_ids[2],))
+            conn.commit()
+
+        sessions = await service.list_sessions_by_user(
+            app_name=APP_NAME,
+            user_id=USER_ID,
+            state_keys=("last_query",)
+        )
+
+        assert [session.id for session in sessions] == [session_ids[3], session_ids[1], session_ids[0]]
+        assert [session.state for session in sessions] == [
+            {},
+            {"last_query": "second"},
+            {"last_query": "first"},
+        ]
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(scenario(make_service(db_dir)))
+
+
+def test_merge_patch_matches_sqlite():
+    """The in-memory merge-patch agrees with SQLite's json_patch."""
+    state = {
+        "user_name": "test_user",
+        "is_authenticated": False,
+        "profile": {"role": "", "tenant": {"id": "t1", "name": "Tenant"}},
+        "history": [1, 2],
+        "flag": "x",
+    }
+    patches = [
+        {"is_authenticated": True, "role": "admin"},
+        {"flag": None, "missing": None},
+        {"profile": {"role": "admin", "tenant": {"name": None}}},
+        {"history": [3], "user_name": {"first": "Test", "last": None}},
+        {"profile": "flattened"},
+    ]
+    with sqlite3.connect(":memory:") as conn:
+        for patch in patches:
+            expected = json.loads(conn.execute(
+                "SELECT json_patch(?, ?)", (json.dumps(state), json.dumps(patch))
+            ).fetchone()[0])
+            merged = _apply_merge_patch(json.loads(json.dumps(state)), patch)
+            assert merged == expected, (patch, merged, expected)
+
+
+def main():
+    """Main function to run all tests."""
+    print("🚀 Starting Session Service Tests...")
+
+    tests = [
+        test_logout_then_validate,
+        test_logout_during_validate_fill,
+        test_clear_during_validate_fill,
+        test_list_sessions_by_user_projection,
+        test_list_sessions_by_user_fallback,
+        test_merge_patch_matches_sqlite,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e!r}")
+
+    if failed:
+        print(f"\n❌ {failed} session service test(s) failed")
+        sys.exit(1)
+    print("\n🎉 All session service tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Tests for the /token-login validation cache in lexedge.api.app.
+Covers token_expiry parsing, TTL capping at the token's own expiry,
+skipping already-expired tokens, and LRU eviction.
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add workspace root to path for testing (go up 3 levels from test file)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from lexedge.api import app as app_module
+from lexedge.api.app import (
+    TOKEN_VALIDATION_TTL,
+    _cache_token_validation,
+    _get_cached_token_validation,
+    _token_seconds_left,
+    _token_validation_cache,
+)
+
+
+def _result(token_expiry=None):
+    data = {"name": "test_user"}
+    if token_expiry is not None:
+        data["token_expiry"] = token_expiry
+    return {"status": "success", "data": data}
+
+
+def _seconds_cached(key):
+    """Remaining lifetime of a cache entry, in seconds."""
+    expires_at, _ = _token_validation_cache[key]
+    return expires_at - time.monotonic()
+
+
+def test_token_seconds_left():
+    """token_expiry parses from epoch seconds and ISO-8601 in its usual spellings."""
+    in_an_hour = datetime.now(timezone.utc) + timedelta(hours=1)
+    expiries = [
+        in_an_hour.timestamp(),
+        int(in_an_hour.timestamp()),
+        str(in_an_hour.timestamp()),
+        in_an_hour.isoformat(),
+        in_an_hour.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        # Naive timestamps are read as UTC
+        in_an_hour.replace(tzinfo=None).isoformat(),
+    ]
+    for expiry in expiries:
+        seconds_left = _token_seconds_left(expiry)
+        assert seconds_left is not None and 3590 < seconds_left <= 3600, (expiry, seconds_left)
+
+    for expiry in (None, "", "tomorrow", True, {"at": 1}):
+        assert _token_seconds_left(expiry) is None, expiry
+
+
+def test_expired_token_not_cached():
+    """A token the backend reports as already expired is never cached."""
+    _token_validation_cache.clear()
+    _cache_token_validation(("expired",), _result(time.time() - 1))
+    assert ("expired",) not in _token_validation_cache
+    assert _get_cached_token_validation(("expired",)) is None
+
+
+def test_ttl_capped_at_token_expiry():
+    """Entries live TOKEN_VALIDATION_TTL at most, and never past the token's expiry."""
+    _token_validation_cache.clear()
+
+    _cache_token_validation(("soon",), _result(time.time() + 60))
+    assert 55 < _seconds_cached(("soon",)) <= 60
+
+    _cache_token_validation(("later",), _result(time.time() + 10 * TOKEN_VALIDATION_TTL))
+    assert TOKEN_VALIDATION_TTL - 5 < _seconds_cached(("later",)) <= TOKEN_VALIDATION_TTL
+
+    # No (or an unparseable) expiry falls back to the default TTL
+    _cache_token_validation(("unknown",), _result("not a date"))
+    assert TOKEN_VALIDATION_TTL - 5 < _seconds_cached(("unknown",)) <= TOKEN_VALIDATION_TTL
+
+    # Entries past their TTL read as misses and are dropped
+    _token_validation_cache[("soon",)] = (time.monotonic() - 1, _result())
+    assert _get_cached_token_validation(("soon",)) is None
+    assert ("soon",) not in _token_validation_cache
+
+
+def test_lru_eviction():
+    """A full cache evicts the least recently used entry."""
+    _token_validation_cache.clear()
+    cache_size = app_module.TOKEN_VALIDATION_CACHE_SIZE
+    app_module.TOKEN_VALIDATION_CACHE_SIZE = 2
+    try:
+        _cache_token_validation(("a",), _result())
+        _cache_token_validation(("b",), _result())
+        # Reading "a" makes "b" the least recently used
+        assert _get_cached_token_validation(("a",)) is not None
+        _cache_token_validation(("c",), _result())
+        assert list(_token_validation_cache) == [("a",), ("c",)]
+    finally:
+        app_module.TOKEN_VALIDATION_CACHE_SIZE = cache_size
+        _token_validation_cache.clear()
+
+
+def main():
+    """Main function to run all tests."""
+    print("🚀 Starting Token Validation Cache Tests...")
+
+    tests = [
+        test_token_seconds_left,
+        test_expired_token_not_cached,
+        test_ttl_capped_at_token_expiry,
+        test_lru_eviction,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e!r}")
+
+    if failed:
+        print(f"\n❌ {failed} token validation cache test(s) failed")
+        sys.exit(1)
+    print("\n🎉 All token validation cache tests passed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 import io
 import os
 import logging
+import shutil
 import tempfile
 import requests
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 
 logger = logging.getLogger(__name__)
 
@@ -31,14 +32,23 @@ def _get_extension(filename: str, content_type: Optional[str]) -> str:
     return extension
 
 
-def _convert_to_wav_file(audio_bytes: bytes, extension: str) -> str:
+def _write_audio(path: str, audio: Union[bytes, BinaryIO]) -> int:
+    """Write raw audio bytes or a binary file object to path; returns the size."""
+    with open(path, "wb") as f:
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            f.write(audio)
+        else:
+            shutil.copyfileobj(audio, f)
+        return f.tell()
+
+
+def _convert_to_wav_file(audio_bytes: Union[bytes, BinaryIO], extension: str) -> str:
     """
     Convert audio to WAV format using ffmpeg directly.
     Returns path to the WAV file.
     """
     import time
     import subprocess
-    import shutil
     
     timestamp = int(time.time() * 1000)
     
@@ -46,10 +56,9 @@ def _convert_to_wav_file(audio_bytes: bytes, extension: str) -> str:
     src_path = os.path.join(UPLOAD_DIR, f"input_{timestamp}.{extension}")
     wav_path = os.path.join(UPLOAD_DIR, f"output_{timestamp}.wav")
     
-    with open(src_path, "wb") as f:
-        f.write(audio_bytes)
+    size = _write_audio(src_path, audio_bytes)
     
-    logger.info(f"Saved input audio to {src_path} ({len(audio_bytes)} bytes)")
+    logger.info(f"Saved input audio to {src_path} ({size} bytes)")
     
     # Check if ffmpeg is available
     if not shutil.which("ffmpeg"):
@@ -104,14 +113,14 @@ def _convert_to_wav_file(audio_bytes: bytes, extension: str) -> str:
         raise RuntimeError(f"Failed to convert audio to WAV: {e}")
 
 
-def transcribe_audio(audio_bytes: bytes, filename: str = "audio.webm", content_type: Optional[str] = None) -> dict:
+def transcribe_audio(audio_bytes: Union[bytes, BinaryIO], filename: str = "audio.webm", content_type: Optional[str] = None) -> dict:
     """
     Transcribe audio using the ASR API.
     
     Converts webm/ogg to WAV file on disk before sending since ASR works best with wav/mp3.
     
     Args:
-        audio_bytes: Raw audio data
+        audio_bytes: Raw audio data, or a binary file object positioned at its start
         filename: Original filename (used to detect format)
         content_type: MIME type of the audio
         
@@ -123,7 +132,7 @@ def transcribe_audio(audio_bytes: bytes, filename: str = "audio.webm", content_t
     
     extension = _get_extension(filename, content_type)
     
-    logger.info(f"Transcribing audio: {len(audio_bytes)} bytes, ext={extension}")
+    logger.info(f"Transcribing audio: ext={extension}")
     
     wav_path = None
     try:
@@ -135,8 +144,8 @@ def transcribe_audio(audio_bytes: bytes, filename: str = "audio.webm", content_t
             # Save directly to file
             timestamp = int(time.time() * 1000)
             wav_path = os.path.join(UPLOAD_DIR, f"input_{timestamp}.{extension}")
-            with open(wav_path, "wb") as f:
-                f.write(audio_bytes)
+            size = _write_audio(wav_path, audio_bytes)
+            logger.info(f"Saved input audio to {wav_path} ({size} bytes)")
             upload_mime = "audio/wav" if extension == "wav" else "audio/mpeg"
         
         logger.info(f"Audio file ready at: {wav_path}")
@@ -43,11 +43,11 @@ async def _latest_session_for_user(user_id: str) -> Optional[Dict[str, Any]]:
 
 
 async def _find_session_by_id(session_id: str) -> Optional[Dict[str, Any]]:
-    sessions = await session_service.list_sessions(app_name=APP_NAME)
-    for session in sessions:
-        if session.id == session_id:
-            return _enrich_state(session)
-    return None
+    # Primary-key lookup; no need to load every session in the app
+    session = await session_service.get_session_by_id(app_name=APP_NAME, session_id=session_id)
+    if session is None:
+        return None
+    return _enrich_state(session)
 
 
 async def _pick_recent_session() -> Optional[Dict[str, Any]]:
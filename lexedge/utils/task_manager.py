@@ -111,6 +111,20 @@ class TaskManager:
             logger.error(f"Error cancelling task {task_id}: {str(e)}")
             return False
     
+    def cancel_all(self, reason: str = "Cancelled by user") -> int:
+        """Cancel every active task under a single lock acquisition."""
+        cancelled_count = 0
+        
+        with self._lock:
+            for active_task in self._active_tasks.values():
+                task = active_task.task
+                if not task.done():
+                    task.cancel()
+                    cancelled_count += 1
+        
+        logger.info(f"🛑 Cancelled {cancelled_count} tasks: {reason}")
+        return cancelled_count
+    
     def get_active_tasks(self, session_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
         """Get information about active tasks."""
         with self._lock:
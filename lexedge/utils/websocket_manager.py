@@ -1,10 +1,54 @@
+import asyncio
 import logging
 import time
+import orjson
 from typing import Dict, Any, Set, Optional
 from fastapi import WebSocket
+from fastapi.websockets import WebSocketState
 
 logger = logging.getLogger(__name__)
 
+def encode_message(data: Dict[str, Any]) -> str:
+    """Encode a message as the compact, non-ASCII-preserving JSON text that
+    WebSocket.send_json produces, using orjson instead of stdlib json"""
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+# Outgoing messages a connection may have waiting before it is treated as stalled
+SEND_QUEUE_SIZE = 256
+
+# Seconds between refreshes of the cached clock used on the per-message path
+CLOCK_TICK_INTERVAL = 0.05
+_cached_now: Optional[float] = None
+_clock_task: Optional[asyncio.Task] = None
+
+def cached_time() -> float:
+    """Wall-clock time, refreshed every CLOCK_TICK_INTERVAL by the clock task
+    (falls back to time.time() when the task isn't running)"""
+    return _cached_now if _cached_now is not None else time.time()
+
+async def _run_clock():
+    """Keep the cached clock current until cancelled"""
+    global _cached_now
+    try:
+        while True:
+            _cached_now = time.time()
+            await asyncio.sleep(CLOCK_TICK_INTERVAL)
+    finally:
+        _cached_now = None
+
+def start_clock():
+    """Start the cached clock task on the running loop"""
+    global _clock_task
+    if _clock_task is None or _clock_task.done():
+        _clock_task = asyncio.create_task(_run_clock())
+
+def stop_clock():
+    """Stop the cached clock task; cached_time() then reads the clock directly"""
+    global _clock_task
+    if _clock_task is not None:
+        _clock_task.cancel()
+        _clock_task = None
+
 class ConnectionManager:
     """Manager for WebSocket connections with tenant isolation"""
     
@@ -14,6 +58,10 @@ class ConnectionManager:
         self.session_connections: Dict[str, str] = {}  # {session_id: connection_id}
         self.tenant_connections: Dict[str, Set[str]] = {}  # {tenant_id: Set[connection_id]}
         self.connection_metadata: Dict[str, Dict[str, Any]] = {}  # {connection_id: metadata}
+        self.send_queues: Dict[str, asyncio.Queue] = {}  # {connection_id: outgoing message queue}
+        self.writer_tasks: Dict[str, asyncio.Task] = {}  # {connection_id: writer task}
+        self.closing_tasks: Set[asyncio.Task] = set()  # server-side closes still in flight
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # loop owning the queues and writers
     
     def _generate_connection_id(self, tenant_id: str, user_id: str, session_id: str) -> str:
         """Generate unique connection ID with tenant isolation"""
@@ -57,9 +105,42 @@ class ConnectionManager:
             "connected_at": time.time()
         }
         
+        # Outgoing messages are queued and written by one task per connection,
+        # so senders never wait on the socket and messages keep their order.
+        # The queues belong to this loop; send_text hands puts from other
+        # threads' loops over to it.
+        self.loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.send_queues[connection_id] = queue
+        self.writer_tasks[connection_id] = asyncio.create_task(
+            self._flush_loop(connection_id, websocket, queue)
+        )
+        
         logger.info(f"✅ Connected: {connection_id}")
         return connection_id
     
+    async def _flush_loop(self, connection_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Write queued messages to a connection, draining whatever has piled
+        up since the last write before waiting again.
+
+        A lone message goes out as its own JSON object; a burst is coalesced
+        into a single frame holding a JSON array of the messages, in order."""
+        try:
+            while True:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                if len(batch) == 1:
+                    await websocket.send_text(batch[0])
+                else:
+                    # Messages are already encoded, so the array is just joined text
+                    await websocket.send_text("[" + ",".join(batch) + "]")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error sending data to connection {connection_id}: {str(e)}")
+            self.disconnect(connection_id)
+    
     def disconnect(self, connection_id: str):
         """Disconnect a WebSocket client"""
         if connection_id not in self.active_connections:
@@ -71,13 +152,18 @@ class ConnectionManager:
         tenant_id = metadata.get("tenant_id")
         
         # Remove from active connections
-        if connection_id in self.active_connections:
-            del self.active_connections[connection_id]
+        websocket = self.active_connections.pop(connection_id)
         if connection_id in self.connection_timestamps:
             del self.connection_timestamps[connection_id]
         if connection_id in self.connection_metadata:
             del self.connection_metadata[connection_id]
         
+        # Stop the writer; anything still queued can't be delivered anyway
+        self.send_queues.pop(connection_id, None)
+        writer = self.writer_tasks.pop(connection_id, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        
         # Remove from session mapping
         if session_id and session_id in self.session_connections:
             if self.session_connections[session_id] == connection_id:
@@ -89,31 +175,84 @@ class ConnectionManager:
             if not self.tenant_connections[tenant_id]:
                 del self.tenant_connections[tenant_id]
         
+        # If the client is still attached, the server dropped it (stalled or failed
+        # writer, replaced session). Close the socket so the endpoint waiting in
+        # receive() gets a disconnect instead of idling on a dead connection.
+        if (websocket.client_state == WebSocketState.CONNECTED
+                and websocket.application_state == WebSocketState.CONNECTED):
+            task = asyncio.create_task(self._close_socket(connection_id, websocket))
+            self.closing_tasks.add(task)
+            task.add_done_callback(self.closing_tasks.discard)
+        
         logger.info(f"❌ Disconnected: {connection_id}")
     
+    async def _close_socket(self, connection_id: str, websocket: WebSocket):
+        """Close a socket the manager has already dropped"""
+        try:
+            await websocket.close(code=1000, reason="Connection closed by server")
+        except Exception as e:
+            logger.debug(f"Socket for {connection_id} was already closed: {str(e)}")
+    
     async def send_json(self, connection_id: str, data: Dict[str, Any]) -> bool:
         """Send JSON data to a specific connection"""
-        if connection_id in self.active_connections:
+        if connection_id not in self.active_connections:
+            logger.warning(f"⚠️ Connection {connection_id} not found in active connections")
+            return False
+        try:
+            text = encode_message(data)
+        except TypeError as e:
+            logger.error(f"❌ Could not encode message for connection {connection_id}: {str(e)}")
+            return False
+        return await self.send_text(connection_id, text, data.get("type", "unknown"))
+    
+    async def send_text(self, connection_id: str, text: str, msg_type: str = "preencoded") -> bool:
+        """Queue an already-encoded JSON message for a specific connection.
+
+        Returns once the message is queued; the connection's writer task
+        sends it. A write failure there disconnects the connection, so later
+        sends to it return False.
+
+        Senders running their own loop in another thread (tool notifications,
+        delayed welcome messages) can't touch the queue directly, since
+        asyncio.Queue isn't thread-safe; their put is scheduled on the owning
+        loop instead and True means the message was handed over.
+        """
+        if connection_id not in self.active_connections:
+            logger.warning(f"⚠️ Connection {connection_id} not found in active connections")
+            return False
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            metadata = self.connection_metadata.get(connection_id, {})
+            logger.debug("🚀 SENDING TO SOCKET: %s (Session: %s, Type: %s)", connection_id, metadata.get("session_id"), msg_type)
+        
+        loop = self.loop
+        if loop is not None and asyncio.get_running_loop() is not loop:
             try:
-                # Get metadata for this connection
-                metadata = self.connection_metadata.get(connection_id, {})
-                msg_type = data.get("type", "unknown")
-                agent = data.get("agent", "N/A")
-                
-                logger.debug(f"🚀 SENDING TO SOCKET: {connection_id} (Session: {metadata.get('session_id')}, Type: {msg_type})")
-                
-                await self.active_connections[connection_id].send_json(data)
-                self.connection_timestamps[connection_id] = time.time()
-                
-                logger.info(f"✅ SENT TO SOCKET: {connection_id}")
-                return True
-            except Exception as e:
-                logger.error(f"❌ Error sending data to connection {connection_id}: {str(e)}")
-                self.disconnect(connection_id)
+                loop.call_soon_threadsafe(self._enqueue, connection_id, text)
+            except RuntimeError as e:
+                # The owning loop has shut down
+                logger.warning(f"⚠️ Could not hand message for {connection_id} to the server loop: {str(e)}")
                 return False
-        else:
+            return True
+        return self._enqueue(connection_id, text)
+    
+    def _enqueue(self, connection_id: str, text: str) -> bool:
+        """Put a message on a connection's send queue; runs on the owning loop"""
+        queue = self.send_queues.get(connection_id)
+        if queue is None:
             logger.warning(f"⚠️ Connection {connection_id} not found in active connections")
-        return False
+            return False
+        try:
+            queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # The client has stopped reading; drop it rather than buffer without bound
+            logger.error(f"❌ Send queue full for connection {connection_id}, disconnecting")
+            self.disconnect(connection_id)
+            return False
+        self.connection_timestamps[connection_id] = cached_time()
+        
+        logger.info("✅ QUEUED FOR SOCKET: %s", connection_id)
+        return True
     
     async def send_to_session(self, session_id: str, data: Dict[str, Any]) -> bool:
         """Send JSON data to a specific session (TENANT ISOLATED)"""
@@ -124,15 +263,27 @@ class ConnectionManager:
         connection_id = self.session_connections[session_id]
         return await self.send_json(connection_id, data)
     
+    async def send_text_to_session(self, session_id: str, text: str) -> bool:
+        """Send an already-encoded JSON message to a specific session (TENANT ISOLATED)"""
+        if session_id not in self.session_connections:
+            logger.warning(f"⚠️ No connection found for session {session_id}")
+            return False
+        
+        connection_id = self.session_connections[session_id]
+        return await self.send_text(connection_id, text)
+    
     async def send_to_tenant(self, tenant_id: str, data: Dict[str, Any]) -> int:
         """Send JSON data to all connections in a tenant"""
         if tenant_id not in self.tenant_connections:
             logger.warning(f"No connections found for tenant {tenant_id}")
             return 0
         
+        # Encode once for every connection in the tenant
+        text = encode_message(data)
+        msg_type = data.get("type", "unknown")
         success_count = 0
         for connection_id in list(self.tenant_connections[tenant_id]):
-            if await self.send_json(connection_id, data):
+            if await self.send_text(connection_id, text, msg_type):
                 success_count += 1
         
         return success_count
@@ -140,20 +291,15 @@ class ConnectionManager:
     def update_timestamp(self, connection_id: str):
         """Update the last activity timestamp for a connection"""
         if connection_id in self.connection_timestamps:
-            self.connection_timestamps[connection_id] = time.time()
+            self.connection_timestamps[connection_id] = cached_time()
     
     async def broadcast(self, message: Dict[str, Any]):
         """Broadcast a message to all connected clients"""
-        disconnected_clients = []
-        for client_id, connection in self.active_connections.items():
-            try:
-                await connection.send_json(message)
-                self.connection_timestamps[client_id] = time.time()
-            except Exception:
-                disconnected_clients.append(client_id)
-        
-        for client_id in disconnected_clients:
-            self.disconnect(client_id)
+        # Encode once for every client; send_text drops stalled clients itself
+        text = encode_message(message)
+        msg_type = message.get("type", "unknown")
+        for client_id in list(self.active_connections):
+            await self.send_text(client_id, text, msg_type)
 
 # Create singleton instance
 manager = ConnectionManager()